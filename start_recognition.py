@@ -2,14 +2,36 @@
 import os
 import time
 import argparse
-import glob
 import logging
 import csv
+import queue
 from pathlib import Path
 from tqdm import tqdm
-from multiprocessing import Pool, cpu_count
-from tools import data_preparator, segmenter, recognizer, transcriptions_parser
-from tools.utils import make_ass, delete_folder, make_wav_scp, create_logger, prepare_wav
+from multiprocessing import cpu_count
+from tools import data_preparator, transcriptions_parser
+from tools.models import ModelCache
+from tools.inbox import Inbox
+from tools.bundle import Bundle
+from tools.scheduler import Scheduler, report_stage, parse_timeouts, START_STAGE
+from tools.metrics import Registry, PipelineStats, MetricsExporter
+from tools.profiler import Profiler, MODES as PROFILE_MODES
+from tools.decoding import DECODING_PROFILES
+from tools.energy_gate import EnergyGate
+from tools.segment_policy import SegmentPolicy
+from tools.utils import make_ass, delete_folder, make_wav_scp, create_logger, prepare_wav, get_wav_duration, \
+    get_channel_regions, set_log_context, start_log_listener, LOGGER_NAME
+
+MODELS = ModelCache()
+
+def start_stage(name):
+    """
+    Отметка начала этапа пайплайна для лога и планировщика
+
+    Аргументы:
+        name: наименование этапа
+    """
+    set_log_context(stage=name)
+    report_stage(name)
 
 def start_pipeline(wav):
     """
@@ -17,7 +39,11 @@ def start_pipeline(wav):
     
     Аргументы:
         wav: путь к .WAV файлу аудио
+
+    Результат:
+        stats: статистика обработки файла
     """
+    set_log_context(wav=Path(wav).name, stage=START_STAGE)
     wav = prepare_wav(wav)
     wav_name = Path(wav).name
     wav_stem = Path(wav).stem
@@ -25,65 +51,77 @@ def start_pipeline(wav):
     os.makedirs(temp, exist_ok=True)
     wav_scp = str(Path(temp) / 'wav.scp')
     make_wav_scp(wav, wav_scp)
+    stats = PipelineStats(wav_name, get_wav_duration(wav), start_stage)
     
     def terminate_pipeline(is_error, message):
         if is_error:
+            stats.error = stats.error or 'unknown'
             LOGGER.error(message)
             os.rename(wav, str(ERROR_DIR / wav_name))
         try:
             delete_folder(temp)
         except:
             LOGGER.error("Не удалось удалить временные файлы для '{}'".format(wav_name))
+        return stats
 
     try:
         LOGGER.info("Запуск сегментации файла '{}'".format(wav_name))
-        segm = segmenter.Segmenter(wav_scp, SEGM_MODEL, SEGM_POST, SEGM_CONF, temp)
-        segments = segm.segment()
+        regions = None
+        if GATE:
+            with stats.stage('energy_gate'):
+                regions, stats.skipped = GATE.detect(wav)
+            LOGGER.info("Исключено {:.1%} аудио файла '{}' по порогу энергии".format(stats.skipped, wav_name))
+        elif SEGMENT_WINDOW:
+            regions = get_channel_regions(wav)
+        with stats.stage('segmentation'):
+            with MODELS.use_segmenter(SEGM_MODEL, SEGM_POST, SEGM_CONF, DECODING_PROFILE, stats, BUNDLE) as segm:
+                segments = segm.segment(regions, SEGMENT_WINDOW, wav_scp, temp, POLICY)
         LOGGER.info("Завершение сегментации файла '{}'".format(wav_name))
     except:
-        terminate_pipeline(True, "Не удалось выполнить сегментацию файла '{}'".format(wav_name))
-        return
+        return terminate_pipeline(True, "Не удалось выполнить сегментацию файла '{}'".format(wav_name))
     if os.stat(segments).st_size == 0:
-        terminate_pipeline(True, "В файле '{}' отсутствуют сегменты".format(wav_name))
-        return
+        stats.error = 'no_segments'
+        return terminate_pipeline(True, "В файле '{}' отсутствуют сегменты".format(wav_name))
 
     try:
         LOGGER.info("Запуск извлечения сегментов из файла '{}'".format(wav_name))
-        wav_segments_scp, utt2spk, spk2utt = segm.extract_segments(segments)
+        with stats.stage('extraction'):
+            wav_segments_scp, utt2spk, spk2utt = segm.extract_segments(segments, wav_scp, temp)
         LOGGER.info("Завершение извлечения сегментов из файла '{}'".format(wav_name))
     except:
-        terminate_pipeline(True, "Не удалось извлечь сегменты из файла '{}'".format(wav_name))
-        return            
+        return terminate_pipeline(True, "Не удалось извлечь сегменты из файла '{}'".format(wav_name))
     try:
         LOGGER.info("Запуск распознавания файла '{}'".format(wav_name))
-        rec = recognizer.Recognizer(wav_segments_scp, REC_MODEL, REC_GRAPH, REC_WORDS, REC_CONF, REC_ICONF, spk2utt, temp)
-        transcriptions = rec.recognize(wav_stem)
+        with stats.stage('recognition'):
+            lattice = str(OUTPUT_DIR / 'lattices' / (wav_stem + '.lat.gz')) if IS_LATTICE else None
+            with MODELS.use_recognizer(REC_MODEL, REC_GRAPH, REC_WORDS, REC_CONF, REC_ICONF, DECODING_PROFILE, 
+                                       IS_LATTICE, BATCH_SIZE, stats, BUNDLE) as rec:
+                transcriptions = rec.recognize(wav_stem, lattice, wav_segments_scp, spk2utt, temp)
         LOGGER.info("Завершение распознавания файла '{}'".format(wav_name))
     except:
-        terminate_pipeline(True, "Не удалось выполнить распознавание файла '{}'".format(wav_name))
-        return
+        return terminate_pipeline(True, "Не удалось выполнить распознавание файла '{}'".format(wav_name))
     try:
         LOGGER.info("Запуск формирования субтитров для файла '{}'".format(wav_name))
-        ass = str(OUTPUT_DIR / str('ass/' + wav_stem + '.ass'))
-        make_ass(wav_name, segments, transcriptions, utt2spk, ass)
+        with stats.stage('subtitles'):
+            ass = str(OUTPUT_DIR / str('ass/' + wav_stem + '.ass'))
+            make_ass(wav_name, segments, transcriptions, utt2spk, ass)
         LOGGER.info("Завершение формирования субтитров для файла '{}'".format(wav_name))
     except:
-        terminate_pipeline(True, "Не удалось сформировать субтитры для файла '{}'".format(wav_name))
-        return
+        return terminate_pipeline(True, "Не удалось сформировать субтитры для файла '{}'".format(wav_name))
     try:
         LOGGER.info("Запуск парсинга транскрибации для файла '{}'".format(wav_name))
-        pars = transcriptions_parser.TranscriptionsParser(
-            str(OUTPUT_DIR / 'ass'),
-            OUTPUT_DIR,
-            LOGGER.handlers[0].baseFilename if IS_LOG else '', 
-            1, 
-            1, 
-            CSV)
-        pars.process_batch_files([ass])
+        with stats.stage('parsing'):
+            pars = transcriptions_parser.TranscriptionsParser(
+                str(OUTPUT_DIR / 'ass'),
+                OUTPUT_DIR,
+                LOG_NAME, 
+                1, 
+                1, 
+                CSV)
+            pars.process_batch_files([ass])
         LOGGER.info("Завершение парсинга транскрибации для файла '{}'".format(wav_name))
     except:
-        terminate_pipeline(True, "Не удалось распарсить транскрибацию файла '{}'".format(wav_name))
-        return
+        return terminate_pipeline(True, "Не удалось распарсить транскрибацию файла '{}'".format(wav_name))
         
     if IS_DELETE_WAV or SLEEP_TIME:
         LOGGER.info("Запуск удаления файла '{}'".format(wav_name))
@@ -92,8 +130,52 @@ def start_pipeline(wav):
         except:
             LOGGER.error("Не удалось удалить файл '{}'".format(wav_name))
         LOGGER.info("Завершение удаления файла '{}'".format(wav_name))
+    else:
+        try:
+            os.rename(wav, str(PROCESSED_DIR / wav_name))
+        except:
+            LOGGER.error("Не удалось перенести распознанный файл '{}' из директории узла".format(wav_name))
+
+    return terminate_pipeline(False, None)
 
-    terminate_pipeline(False, None)
+def start_profiled_pipeline(wav):
+    """
+    Запуск пайплайна распознавания речи с профилированием (при включенном режиме)
+
+    Аргументы:
+        wav: путь к .WAV файлу аудио
+
+    Результат:
+        stats: статистика обработки файла
+    """
+    with PROFILER.profile(Path(wav).stem):
+        return start_pipeline(wav)
+
+def abort_pipeline(wav, stage, reason):
+    """
+    Завершение обработки файла, процесс которой был принудительно остановлен планировщиком
+
+    Аргументы:
+        wav: путь к .WAV файлу аудио
+        stage: этап, на котором был остановлен процесс
+        reason: причина остановки (timeout - превышение длительности этапа, died - аварийное завершение)
+
+    Результат:
+        stats: статистика обработки файла
+    """
+    wav_name = Path(wav).name
+    stats = PipelineStats(wav_name)
+    stats.error = stage
+    REGISTRY.worker_restarts.inc(reason=reason)
+    LOGGER.error("Обработка файла '{}' прервана на этапе '{}' ({})".format(wav_name, stage, reason), 
+                 extra={'wav': wav_name, 'stage': stage})
+    try:
+        if os.path.exists(wav):
+            os.rename(wav, str(ERROR_DIR / wav_name))
+        delete_folder(str(Path(TEMP_DIR) / Path(wav).stem))
+    except:
+        LOGGER.error("Не удалось перенести файл '{}' в директорию ошибок".format(wav_name))
+    return stats
 
 
 if __name__ == '__main__':
@@ -108,11 +190,48 @@ if __name__ == '__main__':
     parser.add_argument('-sm', '--segm_model', help='Путь к .RAW файлу модели сегментации')
     parser.add_argument('-sc', '--segm_conf', help='Путь к .CONF конфигурационному файлу сегментации')
     parser.add_argument('-sp', '--segm_post', help='Путь к .VEC файлу апостериорных вероятностей сегментации')
+    parser.add_argument('-mb', '--model_bundle', default=os.environ.get('STT_BUNDLE') or None, 
+                        help='Путь к пакету моделей, собранному tools/bundle.py build-bundle (заменяет пути к моделям; '
+                             'также задается переменной окружения STT_BUNDLE)')
     parser.add_argument('-p', '--processes', default=None, type=int, help='Количество процессов для обработки файлов')
     parser.add_argument('-l', '--log', dest='log', action='store_true', help='Логировать результат распознавания')
     parser.add_argument('-dw', '--delete_wav', dest='delete_wav', action='store_true', help='Удалять .WAV файлы после распознавания')
     parser.add_argument('-t', '--time', default=None, type=int, help='Пауза перед очередным сканированием директории в секундах')
     parser.add_argument('-d', '--delta', default=None, type=int, help='Дельта, выдерживаемая до чтения файла в минутах')
+    parser.add_argument('-wt', '--watchdog_timeout', default=None, 
+                        help="Ограничение длительности этапа обработки файла в секундах: общее ('600') или по этапам "
+                             "('segmentation=300,recognition=900,*=600')")
+    parser.add_argument('-mr', '--memory_reserve', default=None, type=int, 
+                        help='Объем памяти в МБ, который должен оставаться доступным (включает регулирование числа процессов)')
+    parser.add_argument('-n', '--node', default=None, 
+                        help='Уникальное наименование узла при обработке общей директории несколькими узлами')
+    parser.add_argument('-lx', '--lease_timeout', default=300, type=int, 
+                        help='Время без обновления аренды узла в секундах, после которого его файлы возвращаются в обработку')
+    parser.add_argument('-cb', '--claim_batch', default=None, type=int, 
+                        help='Количество файлов, захватываемых узлом за один раз')
+    parser.add_argument('-mp', '--metrics_port', default=None, type=int, help='Порт HTTP-сервера с метриками в формате Prometheus')
+    parser.add_argument('-dp', '--decoding_profile', default='balanced', choices=list(DECODING_PROFILES), 
+                        help='Профиль декодирования: fast - скорость, balanced - баланс, accurate - точность')
+    parser.add_argument('-lt', '--lattice', dest='lattice', action='store_true', help='Сохранять решетки распознавания')
+    parser.add_argument('-eg', '--energy_gate', dest='energy_gate', action='store_true', 
+                        help='Исключать тихие каналы и продолжительные паузы из сегментации')
+    parser.add_argument('-et', '--gate_threshold', default=-45.0, type=float, help='Порог энергии кадра в дБ')
+    parser.add_argument('-ea', '--gate_min_active', default=0.005, type=float, 
+                        help='Минимальная доля кадров выше порога энергии, при которой канал не исключается')
+    parser.add_argument('-es', '--gate_min_silence', default=3.0, type=float, 
+                        help='Минимальная длительность исключаемой паузы в секундах')
+    parser.add_argument('-ms', '--merge_segments', dest='merge_segments', action='store_true', 
+                        help='Объединять короткие и разбивать длинные сегменты')
+    parser.add_argument('-mn', '--segment_min', default=1.0, type=float, help='Минимальная длительность сегмента в секундах')
+    parser.add_argument('-mx', '--segment_max', default=15.0, type=float, help='Максимальная длительность сегмента в секундах')
+    parser.add_argument('-mg', '--segment_gap', default=0.3, type=float, 
+                        help='Максимальная пауза между объединяемыми сегментами в секундах')
+    parser.add_argument('-sw', '--segment_window', default=None, type=float, 
+                        help='Длительность окна потоковой сегментации в секундах (ограничивает потребление памяти)')
+    parser.add_argument('-bs', '--batch_size', default=None, type=int, 
+                        help='Размер минипакета для пакетного вычисления нейросети распознавания по всем сегментам файла')
+    parser.add_argument('-pr', '--profile', default=os.environ.get('STT_PROFILE') or None, choices=PROFILE_MODES, 
+                        help='Режим профилирования обработки файлов (также задается переменной окружения STT_PROFILE)')
 
     args = parser.parse_args()
 
@@ -126,30 +245,52 @@ if __name__ == '__main__':
     SEGM_MODEL = args.segm_model or 'model/final.raw'
     SEGM_CONF = args.segm_conf or 'model/conf/mfcc_hires.conf'
     SEGM_POST = args.segm_post or 'model/conf/post_output.vec'
+    BUNDLE = Bundle(args.model_bundle) if args.model_bundle else None
     PROCESSES = args.processes or cpu_count()
     IS_LOG = args.log
     IS_DELETE_WAV = args.delete_wav
     SLEEP_TIME = args.time
     DELTA_TIME = args.delta
+    CLAIM_BATCH = args.claim_batch or PROCESSES
+    TIMEOUTS = parse_timeouts(args.watchdog_timeout)
+    MEMORY_RESERVE = args.memory_reserve
+    METRICS_PORT = args.metrics_port
+    DECODING_PROFILE = args.decoding_profile
+    IS_LATTICE = args.lattice
+    BATCH_SIZE = args.batch_size
+    SEGMENT_WINDOW = args.segment_window
+    POLICY = SegmentPolicy(args.segment_min, args.segment_max, args.segment_gap) if args.merge_segments else None
+    GATE = EnergyGate(args.gate_threshold, args.gate_min_active, args.gate_min_silence) if args.energy_gate else None
+    PROFILER = Profiler(args.profile, os.environ.get('STT_PROFILE_DIR') or str(OUTPUT_DIR / 'profiles'))
     
     prep = data_preparator.DataPreparator(args.wav, str(OUTPUT_DIR), args.log)
-    LOG_DIR, TEMP_DIR, ASS_DIR, ERROR_DIR = prep.create_directories()
+    LOG_DIR, TEMP_DIR, ASS_DIR, ERROR_DIR, PROCESSED_DIR = prep.create_directories()
+    if IS_LATTICE:
+        os.makedirs(str(OUTPUT_DIR / 'lattices'), exist_ok=True)
+    REGISTRY = Registry()
+    if METRICS_PORT:
+        MetricsExporter(REGISTRY, METRICS_PORT).start()
+    
+    INBOX = Inbox(WAV_DIR, args.node, args.lease_timeout).start()
     
     while True:
-        wavs = glob.glob(str(WAV_DIR / '*.wav'))
-        if DELTA_TIME:
-            wavs = [wav for wav in wavs if time.time() - os.path.getmtime(wav) > DELTA_TIME * 60]
+        for node, count in INBOX.reclaim().items():
+            print("Возвращено {} файлов узла '{}' с истекшей арендой".format(count, node))
+        wavs = INBOX.claim(CLAIM_BATCH, DELTA_TIME * 60 if DELTA_TIME else None)
         
         if wavs:
             print("Обнаружено {} .WAV файлов".format(len(wavs)))
             if IS_LOG:
                 try:
-                    log_name = str(LOG_DIR / str(time.strftime('%Y%m%d-%H%M%S') + '.log'))
-                    LOGGER = create_logger('logger', 'file', logging.DEBUG, log_name)
+                    LOG_NAME = str(LOG_DIR / str(time.strftime('%Y%m%d-%H%M%S') + '.log'))
+                    LOGGER = create_logger(LOGGER_NAME, 'file', logging.DEBUG, LOG_NAME)
                 except:
                     raise Exception("Не удалось создать лог-файл")
             else:
-                LOGGER = create_logger('logger', 'stream', logging.INFO)
+                LOG_NAME = ''
+                LOGGER = create_logger(LOGGER_NAME, 'stream', logging.INFO)
+            LOG_QUEUE = queue.Queue()
+            listener = start_log_listener(LOGGER, LOG_QUEUE)
 
             try:
                 CSV = str(OUTPUT_DIR / str('transcriptions_' + time.strftime('%Y%m%d-%H%M%S') + '.csv'))
@@ -159,20 +300,29 @@ if __name__ == '__main__':
             except:
                 raise Exception("Не удалось создать результирующий .CSV-файл")
 
-            wavs = prep.rename_wav(wavs)
-            pool = Pool(PROCESSES)
+            scheduler = Scheduler(start_profiled_pipeline, PROCESSES, TIMEOUTS, MEMORY_RESERVE, abort_pipeline, 
+                                  LOGGER_NAME, LOG_QUEUE)
             LOGGER.info("Запуск распознавания речи")
+            LOGGER.debug("Узел обработки: {}".format(INBOX.node))
             LOGGER.debug("Количество процессов: {}".format(PROCESSES))
+            LOGGER.debug("Профиль декодирования: {}".format(DECODING_PROFILE))
             
-            for _ in tqdm(pool.imap(start_pipeline, wavs), total=len(wavs)):
-                pass
-            pool.close()
-            pool.join()
+            try:
+                REGISTRY.queue_depth.set(len(wavs))
+                refill = lambda count: INBOX.claim(min(count, CLAIM_BATCH), DELTA_TIME * 60 if DELTA_TIME else None)
+                for stats in tqdm(scheduler.run(wavs, refill)):
+                    REGISTRY.record(stats)
+                    REGISTRY.queue_depth.set(len(scheduler.pending))
+                    REGISTRY.active_workers.set(scheduler.busy)
+            finally:
+                scheduler.close()
+                listener.stop()
             LOGGER.info("Завершение распознавания речи")
 
         if SLEEP_TIME:
             print("Мониторинг директории с .WAV файлами...")
             time.sleep(SLEEP_TIME)
         else:
+            INBOX.stop()
             break
 
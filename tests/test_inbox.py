@@ -0,0 +1,92 @@
+import os
+import glob
+import time
+import multiprocessing
+from pathlib import Path
+from tools.inbox import Inbox, CLAIMS_DIR, LEASE_FILE
+
+NODES = 8
+FILES = 200
+
+def make_wavs(directory, count):
+    for i in range(count):
+        Path(directory, '{:04d}.wav'.format(i)).write_bytes(b'')
+
+def claim_all(directory, node, barrier, results):
+    inbox = Inbox(directory, node).start()
+    barrier.wait()
+    claimed = []
+    while True:
+        wavs = inbox.claim(1)
+        if not wavs:
+            break
+        claimed.extend(Path(wav).name for wav in wavs)
+    results.put(claimed)
+
+def test_claim_without_duplicates(tmp_path):
+    make_wavs(tmp_path, FILES)
+    barrier = multiprocessing.Barrier(NODES)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=claim_all, args=(str(tmp_path), 'node-{}'.format(i), barrier, results))
+                 for i in range(NODES)]
+    for process in processes:
+        process.start()
+    claimed = [wav for _ in processes for wav in results.get(timeout=60)]
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    assert len(claimed) == FILES
+    assert sorted(claimed) == sorted('{:04d}.wav'.format(i) for i in range(FILES))
+    assert not list(tmp_path.glob('*.wav'))
+
+def test_reclaim_stale_node(tmp_path):
+    stale = tmp_path / CLAIMS_DIR / 'stale'
+    os.makedirs(str(stale))
+    make_wavs(stale, 3)
+    (stale / LEASE_FILE).touch()
+    past = time.time() - 600
+    os.utime(str(stale / LEASE_FILE), (past, past))
+    inbox = Inbox(str(tmp_path), 'alive', lease_timeout=300).start()
+    assert inbox.reclaim() == {'stale': 3}
+    assert not stale.exists()
+    assert len(inbox.claim()) == 3
+
+def test_keep_fresh_node(tmp_path):
+    fresh = tmp_path / CLAIMS_DIR / 'fresh'
+    os.makedirs(str(fresh))
+    make_wavs(fresh, 2)
+    (fresh / LEASE_FILE).touch()
+    inbox = Inbox(str(tmp_path), 'alive', lease_timeout=300).start()
+    assert inbox.reclaim() == {}
+    assert len(list(fresh.glob('*.wav'))) == 2
+
+def test_recreate_removed_claim_dir(tmp_path):
+    make_wavs(tmp_path, 1)
+    inbox = Inbox(str(tmp_path), 'slow').start()
+    Inbox(str(tmp_path), 'other').restore(inbox.claim_dir)
+    assert not inbox.claim_dir.exists()
+    assert len(inbox.claim()) == 1
+    assert (inbox.claim_dir / LEASE_FILE).exists()
+
+def test_reclaim_keeps_files_claimed_during_restore(tmp_path, monkeypatch):
+    make_wavs(tmp_path, 2)
+    slow = Inbox(str(tmp_path), 'slow').start()
+    assert [Path(wav).name for wav in slow.claim(1)] == ['0000.wav']
+    past = time.time() - 600
+    os.utime(str(slow.lease), (past, past))
+    other = Inbox(str(tmp_path), 'other', lease_timeout=300).start()
+    original = glob.glob
+    raced = []
+
+    def racing_glob(pattern):
+        wavs = original(pattern)
+        if CLAIMS_DIR in pattern and not raced:
+            raced.append(slow.claim(1))
+        return wavs
+
+    monkeypatch.setattr(glob, 'glob', racing_glob)
+    assert other.reclaim() == {'slow': 1}
+    assert [Path(wav).name for wav in raced[0]] == ['0001.wav']
+    assert (slow.claim_dir / '0001.wav').exists()
+    assert (tmp_path / '0000.wav').exists()
+    assert sorted(other.status()) == ['other', 'slow']
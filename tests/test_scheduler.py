@@ -0,0 +1,19 @@
+import os
+import signal
+from tools.scheduler import Scheduler
+
+def echo(task):
+    return task
+
+def test_replace_idle_worker_killed():
+    scheduler = Scheduler(echo, 1)
+    try:
+        assert list(scheduler.run(['a'])) == ['a']
+        worker = scheduler.workers[0]
+        os.kill(worker.process.pid, signal.SIGKILL)
+        worker.process.join()
+        assert list(scheduler.run(['b'])) == ['b']
+        assert scheduler.restarts == 1
+        assert worker not in scheduler.workers
+    finally:
+        scheduler.close()
@@ -0,0 +1,33 @@
+import numpy as np
+from tools.segment_policy import SegmentPolicy
+
+def lengths(segments):
+    return [end - start for start, end, _ in segments]
+
+def test_merge_short_segments():
+    policy = SegmentPolicy(1.0, 15.0, 0.3)
+    segments = [(0, 50, 'a'), (60, 120, 'a'), (500, 700, 'a')]
+    assert policy.merge(segments) == [(0, 120, 'a'), (500, 700, 'a')]
+
+def test_merge_keeps_distant_segments():
+    policy = SegmentPolicy(1.0, 15.0, 0.3)
+    segments = [(0, 50, 'a'), (100, 150, 'a')]
+    assert policy.merge(segments) == segments
+
+def test_split_examples():
+    np.random.seed(0)
+    for min_length, max_length, length in [(6, 10, 2007), (5, 8, 1602)]:
+        policy = SegmentPolicy(min_length, max_length)
+        for energy in (None, np.random.rand(length)):
+            parts = lengths(policy.split([(0, length, 'a')], energy))
+            assert sum(parts) == length
+            assert all(policy.min_frames <= part <= policy.max_frames for part in parts)
+
+def test_split_random_lengths():
+    np.random.seed(1)
+    policy = SegmentPolicy(1.0, 15.0)
+    for length in np.random.randint(1501, 10000, 200):
+        energy = np.random.rand(length)
+        parts = lengths(policy.split([(0, int(length), 'a')], energy))
+        assert sum(parts) == length
+        assert all(policy.min_frames <= part <= policy.max_frames for part in parts)
@@ -0,0 +1,151 @@
+#!/usr/bin/python
+import os
+import json
+import time
+import argparse
+import itertools
+from pathlib import Path
+from tools.utils import get_wav_duration
+from tools.recognizer import Recognizer
+
+def read_table(path):
+    """
+    Чтение таблицы Kaldi вида "ключ значение"
+
+    Аргументы:
+        path: путь к файлу таблицы
+
+    Результат:
+        table: словарь значений по ключам
+    """
+    table = {}
+    with open(path, 'r') as f:
+        for line in f:
+            parts = line.rstrip('\n').split(None, 1)
+            if parts:
+                table[parts[0]] = parts[1] if len(parts) > 1 else ''
+    return table
+
+def edit_distance(ref, hyp):
+    """
+    Расчет расстояния Левенштейна между последовательностями слов
+
+    Аргументы:
+        ref: эталонная последовательность слов
+        hyp: распознанная последовательность слов
+
+    Результат:
+        distance: количество ошибок (замен, вставок и удалений)
+    """
+    row = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, hyp_word in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (ref_word != hyp_word))
+    return row[-1]
+
+def word_error_rate(refs, hyps):
+    """
+    Расчет доли ошибочно распознанных слов (WER)
+
+    Аргументы:
+        refs: словарь эталонных транскрибаций по сегментам
+        hyps: словарь распознанных транскрибаций по сегментам
+
+    Результат:
+        wer: доля ошибочно распознанных слов
+    """
+    errors = words = 0
+    for utt_id, ref in refs.items():
+        ref = ref.lower().split()
+        errors += edit_distance(ref, hyps.get(utt_id, '').lower().split())
+        words += len(ref)
+    return errors / words if words else 0.0
+
+def pareto_front(results):
+    """
+    Отбор конфигураций, не доминируемых по WER и RTF
+
+    Аргументы:
+        results: список результатов конфигураций
+
+    Результат:
+        front: список недоминируемых конфигураций, упорядоченный по RTF
+    """
+    front = []
+    for result in sorted(results, key=lambda r: (r['rtf'], r['wer'])):
+        if not front or result['wer'] < front[-1]['wer']:
+            front.append(result)
+    return front
+
+def resolve_scp(scp, root, output):
+    """
+    Формирование .SCP файла с абсолютными путями к аудио
+
+    Аргументы:
+        scp: путь к .SCP файлу с аудио сегментов
+        root: директория, относительно которой заданы пути в .SCP файле
+        output: путь к директории с результатами
+
+    Результат:
+        scp: путь к .SCP файлу с абсолютными путями
+        duration: суммарная длительность аудио в секундах
+    """
+    resolved = str(Path(output) / 'wav.scp')
+    duration = 0.0
+    with open(resolved, 'w') as f:
+        for utt_id, wav in read_table(scp).items():
+            if not wav.endswith('|'):
+                wav = str((Path(root) / wav).resolve())
+                duration += get_wav_duration(wav)
+            f.write(utt_id + '\t' + wav + '\n')
+    return resolved, duration
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Утилита для подбора параметров декодирования по соотношению WER и RTF')
+    parser.add_argument('scp', metavar='SCP', help='Путь к .SCP файлу с аудио сегментов')
+    parser.add_argument('spk2utt', metavar='SPK2UTT', help='Путь к файлу перечисления сегментов для каждого говорящего')
+    parser.add_argument('text', metavar='TEXT', help='Путь к файлу эталонных транскрибаций сегментов')
+    parser.add_argument('-r', '--root', default='.', help='Директория, относительно которой заданы пути в .SCP файле')
+    parser.add_argument('-o', '--output', default='sweep', help='Путь к директории с результатами подбора')
+    parser.add_argument('-b', '--beams', nargs='+', default=[8.0, 10.0, 13.0, 16.0], type=float, help='Значения beam')
+    parser.add_argument('-lb', '--lattice_beams', nargs='+', default=[4.0, 6.0, 8.0, 10.0], type=float, help='Значения lattice-beam')
+    parser.add_argument('-ma', '--max_actives', nargs='+', default=[2000, 4000, 7000], type=int, help='Значения max-active')
+    parser.add_argument('-dp', '--decoding_profile', default=None, help='Базовый профиль декодирования')
+    parser.add_argument('-rm', '--rec_model', default='model/final.mdl', help='Путь к .MDL файлу модели распознавания')
+    parser.add_argument('-rg', '--rec_graph', default='model/HCLG.fst', help='Путь к .FST файлу общего графа распознавания')
+    parser.add_argument('-rw', '--rec_words', default='model/words.txt', help='Путь к .TXT файлу текстового корпуса')
+    parser.add_argument('-rc', '--rec_conf', default='model/conf/mfcc.conf', help='Путь к .CONF конфигурационному файлу распознавания')
+    parser.add_argument('-ri', '--rec_iconf', default='model/conf/ivector_extractor.conf', help='Путь к .CONF конфигурационному файлу векторного экстрактора')
+
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    scp, duration = resolve_scp(args.scp, args.root, args.output)
+    refs = read_table(args.text)
+    rec = Recognizer(scp, args.rec_model, args.rec_graph, args.rec_words, args.rec_conf, args.rec_iconf,
+                     args.spk2utt, args.output, profile=args.decoding_profile)
+
+    results = []
+    for beam, lattice_beam, max_active in itertools.product(args.beams, args.lattice_beams, args.max_actives):
+        if lattice_beam > beam:
+            continue
+        rec.configure(args.decoding_profile, {'beam': beam, 'lattice_beam': lattice_beam, 'max_active': max_active})
+        name = 'sweep_{}_{}_{}'.format(beam, lattice_beam, max_active)
+        start_time = time.perf_counter()
+        transcriptions = rec.recognize(name)
+        wall = time.perf_counter() - start_time
+        result = {'beam': beam, 'lattice_beam': lattice_beam, 'max_active': max_active,
+                  'wer': round(word_error_rate(refs, read_table(transcriptions)), 4),
+                  'rtf': round(wall / duration, 4) if duration else None}
+        os.remove(transcriptions)
+        results.append(result)
+        print("beam={beam} lattice_beam={lattice_beam} max_active={max_active}: WER {wer:.2%}, RTF {rtf}".format(**result))
+
+    front = pareto_front([result for result in results if result['rtf'] is not None])
+    print("Парето-фронт WER/RTF:")
+    for result in front:
+        print("  beam={beam} lattice_beam={lattice_beam} max_active={max_active}: WER {wer:.2%}, RTF {rtf}".format(**result))
+    with open(str(Path(args.output) / 'sweep.json'), 'w') as f:
+        json.dump({'duration': duration, 'results': results, 'pareto_front': front}, f, ensure_ascii=False, indent=2)
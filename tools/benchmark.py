@@ -0,0 +1,416 @@
+#!/usr/bin/python
+import os
+import sys
+import json
+import time
+import wave
+import platform
+import argparse
+import resource
+import threading
+from pathlib import Path
+import numpy as np
+import soundfile
+from tools.utils import make_ass, make_wav_scp, make_spk2utt, prepare_wav, delete_folder, get_wav_duration
+from tools import transcriptions_parser
+from tools.scheduler import get_process_rss
+
+RSS_INTERVAL = 0.01
+STAGES = ['prepare_wav', 'segment', 'extract_segments', 'recognize', 'make_ass', 'parse_transcriptions']
+
+def make_synthetic_wav(wav, duration, channels, sample_rate=8000, seed=0):
+    """
+    Генерация детерминированного синтетического аудио
+
+    Аргументы:
+        wav: путь к .WAV файлу аудио
+        duration: длительность аудио в секундах
+        channels: количество каналов
+        sample_rate: частота дискретизации
+        seed: начальное значение генератора случайных чисел
+
+    Результат:
+        wav: путь к .WAV файлу аудио
+    """
+    rng = np.random.RandomState(seed)
+    length = int(duration * sample_rate)
+    t = np.arange(length) / sample_rate
+    data = np.zeros((length, channels), dtype=np.float32)
+    for channel in range(channels):
+        position = 0
+        while position < length:
+            burst = int(rng.uniform(0.5, 4.0) * sample_rate)
+            pause = int(rng.uniform(0.3, 2.0) * sample_rate)
+            end = min(position + burst, length)
+            pitch = rng.uniform(100, 250)
+            envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t[position:end])
+            voice = sum(np.sin(2 * np.pi * pitch * k * t[position:end]) / k for k in range(1, 6))
+            noise = rng.normal(0, 0.05, end - position)
+            data[position:end, channel] = 0.2 * envelope * voice + noise
+            position = end + pause
+        data[:, channel] += rng.normal(0, 0.002, length)
+    soundfile.write(wav, np.clip(data, -1, 1), sample_rate, subtype='PCM_16')
+    return wav
+
+class StubSegmenter(object):
+    """Класс-заглушка сегментатора на основе порога энергии для запуска без модели"""
+
+    def __init__(self, wav, output, frame_shift=0.01, threshold=0.02):
+        """
+        Инициализация сегментатора-заглушки
+
+        Аргументы:
+            wav: путь к .WAV файлу аудио
+            output: путь к директории с результатами сегментации
+            frame_shift: сдвиг кадра в секундах
+            threshold: порог среднеквадратичной амплитуды кадра
+        """
+        self.wav = wav
+        self.output = Path(output)
+        self.frame_shift = frame_shift
+        self.threshold = threshold
+
+    def segment(self):
+        """
+        Выполнение сегментации
+
+        Результат:
+            segments: путь к файлу описания сегментов
+        """
+        data, sr = soundfile.read(self.wav, dtype='float32', always_2d=True)
+        hop = int(sr * self.frame_shift)
+        segments = str(self.output / 'segments')
+        with open(segments, 'w') as s:
+            for channel in range(data.shape[1]):
+                key = Path(self.wav).stem + '.' + str(channel)
+                frames = data[:len(data) // hop * hop, channel].reshape(-1, hop)
+                active = np.sqrt((frames ** 2).mean(axis=1)) > self.threshold
+                edges = np.flatnonzero(np.diff(np.concatenate([[0], active.astype(np.int8), [0]])))
+                for start, end in zip(edges[::2], edges[1::2]):
+                    if end - start < 30:
+                        continue
+                    s.write('{}-2-{:07d}-{:07d} {} {:.2f} {:.2f}\n'.format(key, start, end, key,
+                            start * self.frame_shift, end * self.frame_shift))
+        return segments
+
+    def extract_segments(self, segments):
+        """
+        Извлечение сегментов
+
+        Аргументы:
+            segments: путь к файлу описания сегментов
+
+        Результат:
+            wav_segments: путь к .SCP файлу с аудио сегментов
+            utt2spk: путь к файлу сопоставления сегментов и говорящих
+            spk2utt: путь к файлу перечисления сегментов для каждого говорящего
+        """
+        data, sr = soundfile.read(self.wav, dtype='float32', always_2d=True)
+        wav_segments = str(self.output / 'wav_segments.scp')
+        utt2spk = str(self.output / 'utt2spk')
+        with open(segments, 'r') as s, \
+            open(wav_segments, 'w') as ws, \
+            open(utt2spk, 'w') as u:
+            for segment in s:
+                segment_id, recording, start, end = segment.split()
+                channel = int(recording.split('.')[-1])
+                segment_wav = str(self.output / (segment_id + '.wav'))
+                soundfile.write(segment_wav, data[int(float(start) * sr):int(float(end) * sr), channel], sr)
+                ws.write(segment_id + '\t' + segment_wav + '\n')
+                u.write(segment_id + '\tКанал ' + str(channel) + '\n')
+        spk2utt = make_spk2utt(utt2spk)
+        return wav_segments, utt2spk, spk2utt
+
+class StubRecognizer(object):
+    """Класс-заглушка распознавателя для запуска без модели"""
+
+    def __init__(self, scp, output):
+        """
+        Инициализация распознавателя-заглушки
+
+        Аргументы:
+            scp: путь к .SCP файлу с аудио сегментов
+            output: путь к директории с результатами распознавания
+        """
+        self.scp = scp
+        self.output = Path(output)
+
+    def recognize(self, wav=None):
+        """
+        Распознавание речи
+
+        Аргументы:
+            wav: наименование аудио файла
+
+        Результат:
+            transcriptions: путь к файлу транскрибации
+        """
+        transcriptions = str(self.output / wav) if wav else 'transcriptions'
+        with open(self.scp, 'r') as scp, open(transcriptions, 'a') as f:
+            for line in scp:
+                f.write(line.split('\t')[0] + '\tтест\n')
+        return transcriptions
+
+def reset_peak_rss():
+    """
+    Сброс пиковой резидентной памяти процесса (VmHWM)
+
+    Результат:
+        reset: признак успешного сброса
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def get_peak_rss():
+    """
+    Получение пиковой резидентной памяти процесса (VmHWM)
+
+    Результат:
+        rss: объем памяти в МБ
+    """
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+class RssSampler(threading.Thread):
+    """Класс потока, замеряющего резидентную память процесса и его дочерних процессов во время этапа"""
+
+    def __init__(self, interval=RSS_INTERVAL):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = 0.0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while True:
+            self.peak = max(self.peak, get_process_rss(os.getpid()))
+            if self.stopped.wait(self.interval):
+                break
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.peak
+
+class StageTimer(object):
+    """Класс для измерения ресурсов, затраченных на этап пайплайна"""
+
+    def __init__(self, duration):
+        """
+        Инициализация таймера
+
+        Аргументы:
+            duration: длительность аудио в секундах
+        """
+        self.duration = duration
+        self.stages = {}
+
+    def run(self, stage, func, *args):
+        """
+        Запуск этапа с измерением времени, процессорного времени и пиковой памяти этапа (максимум VmHWM 
+        процесса после сброса и резидентной памяти процесса с дочерними процессами, замеряемой в потоке)
+
+        Аргументы:
+            stage: наименование этапа
+            func: функция этапа
+            args: аргументы функции
+
+        Результат:
+            result: результат функции
+        """
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        hwm = reset_peak_rss()
+        sampler = RssSampler()
+        sampler.start()
+        start_wall = time.perf_counter()
+        try:
+            result = func(*args)
+        finally:
+            wall = time.perf_counter() - start_wall
+            peak_rss = sampler.stop()
+        if hwm:
+            peak_rss = max(peak_rss, get_peak_rss())
+        self_end = resource.getrusage(resource.RUSAGE_SELF)
+        children_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = (self_end.ru_utime + self_end.ru_stime - self_usage.ru_utime - self_usage.ru_stime +
+               children_end.ru_utime + children_end.ru_stime - children_usage.ru_utime - children_usage.ru_stime)
+        self.stages[stage] = {'wall': round(wall, 4),
+                              'cpu': round(cpu, 4),
+                              'peak_rss_mb': round(peak_rss, 1),
+                              'rtf': round(wall / self.duration, 5) if self.duration else None}
+        return result
+
+def models_available(paths):
+    """
+    Проверка наличия файлов модели и библиотеки pykaldi
+
+    Аргументы:
+        paths: список путей к файлам модели
+
+    Результат:
+        available: признак доступности модели
+    """
+    if not all(os.path.exists(path) for path in paths):
+        return False
+    try:
+        import kaldi
+    except ImportError:
+        return False
+    return True
+
+def run_benchmark(wav, output, models, stub_segmenter, stub_recognizer):
+    """
+    Запуск пайплайна распознавания с замером этапов
+
+    Аргументы:
+        wav: путь к .WAV файлу аудио
+        output: путь к директории с временными файлами
+        models: словарь путей к файлам модели
+        stub_segmenter: признак использования сегментатора-заглушки
+        stub_recognizer: признак использования распознавателя-заглушки
+
+    Результат:
+        run: результаты замеров
+    """
+    duration = get_wav_duration(wav)
+    with wave.open(wav, 'r') as wav_file:
+        channels = wav_file.getnchannels()
+    timer = StageTimer(duration)
+    temp = str(Path(output) / Path(wav).stem)
+    os.makedirs(temp, exist_ok=True)
+    wav = timer.run('prepare_wav', prepare_wav, wav)
+    wav_scp = str(Path(temp) / 'wav.scp')
+    make_wav_scp(wav, wav_scp)
+    if stub_segmenter:
+        segm = StubSegmenter(wav, temp)
+    else:
+        from tools import segmenter
+        segm = segmenter.Segmenter(wav_scp, models['segm_model'], models['segm_post'], models['segm_conf'], temp)
+    segments = timer.run('segment', segm.segment)
+    wav_segments_scp, utt2spk, spk2utt = timer.run('extract_segments', segm.extract_segments, segments)
+    if stub_recognizer:
+        rec = StubRecognizer(wav_segments_scp, temp)
+    else:
+        from tools import recognizer
+        rec = recognizer.Recognizer(wav_segments_scp, models['rec_model'], models['rec_graph'], models['rec_words'],
+                                    models['rec_conf'], models['rec_iconf'], spk2utt, temp)
+    transcriptions = timer.run('recognize', rec.recognize, Path(wav).stem)
+    ass = str(Path(temp) / (Path(wav).stem + '.ass'))
+    timer.run('make_ass', make_ass, Path(wav).name, segments, transcriptions, utt2spk, ass)
+    pars = transcriptions_parser.TranscriptionsParser('', Path(temp), '', 1, 1, str(Path(temp) / 'transcriptions.csv'))
+    timer.run('parse_transcriptions', pars.process_batch_files, [ass])
+    delete_folder(temp)
+    return {'audio': Path(wav).name, 'channels': channels, 'duration': duration, 'stages': timer.stages}
+
+def summarize(runs):
+    """
+    Агрегация результатов замеров по этапам
+
+    Аргументы:
+        runs: список результатов замеров
+
+    Результат:
+        summary: словарь суммарных показателей по этапам
+    """
+    duration = sum(run['duration'] for run in runs)
+    summary = {}
+    for stage in STAGES:
+        wall = sum(run['stages'][stage]['wall'] for run in runs)
+        cpu = sum(run['stages'][stage]['cpu'] for run in runs)
+        summary[stage] = {'wall': round(wall, 4),
+                          'cpu': round(cpu, 4),
+                          'peak_rss_mb': max(run['stages'][stage]['peak_rss_mb'] for run in runs),
+                          'rtf': round(wall / duration, 5) if duration else None}
+    return summary
+
+def compare(current, previous, tolerance):
+    """
+    Сравнение результатов с предыдущим запуском
+
+    Аргументы:
+        current: сводные показатели текущего запуска
+        previous: сводные показатели предыдущего запуска
+        tolerance: допустимый относительный рост коэффициента реального времени
+
+    Результат:
+        regressions: список этапов с деградацией производительности
+    """
+    regressions = []
+    for stage in STAGES:
+        old, new = previous.get(stage, {}).get('rtf'), current[stage]['rtf']
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        print("{:<22} RTF {:.5f} -> {:.5f} ({:+.1%})".format(stage, old, new, change))
+        if change > tolerance:
+            regressions.append(stage)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Утилита для замера производительности пайплайна распознавания')
+    parser.add_argument('output', metavar='JSON', help='Путь к .JSON файлу с результатами замеров')
+    parser.add_argument('-L', '--lengths', nargs='+', default=[10, 60, 300], type=float, help='Длительности синтетического аудио в секундах')
+    parser.add_argument('-ch', '--channels', nargs='+', default=[1, 2], type=int, help='Количество каналов синтетического аудио')
+    parser.add_argument('-s', '--seed', default=0, type=int, help='Начальное значение генератора случайных чисел')
+    parser.add_argument('-w', '--workdir', default='benchmark', help='Путь к директории с временными файлами')
+    parser.add_argument('-c', '--compare', help='Путь к .JSON файлу предыдущего запуска для сравнения')
+    parser.add_argument('-tl', '--tolerance', default=0.1, type=float, help='Допустимый относительный рост RTF при сравнении')
+    parser.add_argument('--stub', dest='stub', action='store_true', help='Использовать заглушки вместо модели')
+    parser.add_argument('-rm', '--rec_model', default='model/final.mdl', help='Путь к .MDL файлу модели распознавания')
+    parser.add_argument('-rg', '--rec_graph', default='model/HCLG.fst', help='Путь к .FST файлу общего графа распознавания')
+    parser.add_argument('-rw', '--rec_words', default='model/words.txt', help='Путь к .TXT файлу текстового корпуса')
+    parser.add_argument('-rc', '--rec_conf', default='model/conf/mfcc.conf', help='Путь к .CONF конфигурационному файлу распознавания')
+    parser.add_argument('-ri', '--rec_iconf', default='model/conf/ivector_extractor.conf', help='Путь к .CONF конфигурационному файлу векторного экстрактора')
+    parser.add_argument('-sm', '--segm_model', default='model/final.raw', help='Путь к .RAW файлу модели сегментации')
+    parser.add_argument('-sc', '--segm_conf', default='model/conf/mfcc_hires.conf', help='Путь к .CONF конфигурационному файлу сегментации')
+    parser.add_argument('-sp', '--segm_post', default='model/conf/post_output.vec', help='Путь к .VEC файлу апостериорных вероятностей сегментации')
+
+    args = parser.parse_args()
+
+    models = {'rec_model': args.rec_model, 'rec_graph': args.rec_graph, 'rec_words': args.rec_words,
+              'rec_conf': args.rec_conf, 'rec_iconf': args.rec_iconf, 'segm_model': args.segm_model,
+              'segm_conf': args.segm_conf, 'segm_post': args.segm_post}
+    stub_segmenter = args.stub or not models_available([args.segm_model, args.segm_post, args.segm_conf])
+    stub_recognizer = args.stub or not models_available([args.rec_model, args.rec_graph, args.rec_words,
+                                                         args.rec_conf, args.rec_iconf])
+    if stub_segmenter or stub_recognizer:
+        print("Файлы модели недоступны, используются заглушки: сегментация - {}, распознавание - {}".format(
+            stub_segmenter, stub_recognizer))
+
+    workdir = Path(args.workdir)
+    os.makedirs(str(workdir), exist_ok=True)
+    runs = []
+    for channels in args.channels:
+        for length in args.lengths:
+            wav = str(workdir / 'synthetic_{}ch_{}s.wav'.format(channels, int(length)))
+            make_synthetic_wav(wav, length, channels, seed=args.seed)
+            run = run_benchmark(wav, str(workdir), models, stub_segmenter, stub_recognizer)
+            runs.append(run)
+            print("{}: {}".format(run['audio'], ', '.join(
+                "{} RTF {:.4f}".format(stage, run['stages'][stage]['rtf']) for stage in STAGES)))
+            os.remove(wav)
+
+    result = {'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+              'host': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+              'stub': {'segmenter': stub_segmenter, 'recognizer': stub_recognizer},
+              'seed': args.seed,
+              'runs': runs,
+              'summary': summarize(runs)}
+    with open(args.output, 'w') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            previous = json.load(f)
+        regressions = compare(result['summary'], previous['summary'], args.tolerance)
+        if regressions:
+            print("Обнаружена деградация производительности: {}".format(', '.join(regressions)))
+            sys.exit(1)
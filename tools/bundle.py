@@ -0,0 +1,265 @@
+#!/usr/bin/python
+import os
+import time
+import json
+import shutil
+import hashlib
+import argparse
+import tempfile
+from pathlib import Path
+from kaldi.asr import NnetLatticeFasterRecognizer
+from kaldi.fstext import SymbolTable, StdVectorFst, StdConstFst, read_fst_kaldi
+from kaldi.matrix import Matrix
+from kaldi.segmentation import NnetSAD
+from kaldi.util.io import xopen
+
+BUNDLE_FORMAT = 1
+MANIFEST = 'manifest.json'
+SEGM_MODEL = 'segmenter/final.raw'
+SEGM_CONF = 'segmenter/mfcc_hires.conf'
+SAD_TRANSFORM = 'segmenter/sad_transform.mat'
+SAD_GRAPH = 'segmenter/sad_graph.fst'
+REC_MODEL = 'recognizer/final.mdl'
+REC_GRAPH = 'recognizer/HCLG.const.fst'
+REC_WORDS = 'recognizer/words.sym'
+REC_CONF = 'recognizer/mfcc.conf'
+REC_ICONF = 'recognizer/ivector_extractor.conf'
+IVECTOR_DIR = 'recognizer/ivector_extractor'
+
+def get_checksum(path):
+    """
+    Расчет контрольной суммы файла
+
+    Аргументы:
+        path: путь к файлу
+
+    Результат:
+        checksum: контрольная сумма SHA-256
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def resolve_conf_path(value, conf):
+    """
+    Поиск файла, указанного в конфигурационном файле Kaldi; абсолютные пути другой установки
+    (например, /speech_recognition/model/...) сопоставляются с директорией модели конфигурационного файла
+
+    Аргументы:
+        value: путь из конфигурационного файла
+        conf: путь к конфигурационному файлу
+
+    Результат:
+        path: путь к существующему файлу или None
+    """
+    path = Path(value)
+    candidates = [path, Path(conf).parent / path.name]
+    if 'model' in path.parts:
+        model_dir = Path(conf).resolve().parent.parent
+        candidates.append(model_dir / Path(*path.parts[len(path.parts) - path.parts[::-1].index('model'):]))
+    for candidate in candidates:
+        if candidate.is_file():
+            return candidate
+    return None
+
+def copy_ivector_conf(iconf, output):
+    """
+    Копирование конфигурационного файла векторного экстрактора и указанных в нем файлов в пакет
+    с заменой путей на относительные пути пакета
+
+    Аргументы:
+        iconf: путь к .CONF конфигурационному файлу векторного экстрактора
+        output: путь к директории пакета
+    """
+    os.makedirs(str(output / IVECTOR_DIR), exist_ok=True)
+    lines = []
+    with open(iconf, 'r') as f:
+        for line in f:
+            option, sep, value = line.strip().partition('=')
+            path = resolve_conf_path(value, iconf) if sep and ('/' in value or '.' in value) else None
+            if path is None and sep and '/' in value:
+                raise ValueError("Не найден файл '{}', указанный в '{}'".format(value, iconf))
+            if path is not None:
+                target = Path(IVECTOR_DIR) / path.name
+                shutil.copyfile(str(path), str(output / target))
+                value = str(target.relative_to(Path(REC_ICONF).parent))
+            lines.append(option + sep + value)
+    with open(str(output / REC_ICONF), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+def build_bundle(output, segm_model, segm_post, segm_conf, rec_model, rec_graph, rec_words, rec_conf, rec_iconf,
+                 version=None):
+    """
+    Сборка пакета моделей с предварительно рассчитанными объектами сегментации и распознавания
+
+    Аргументы:
+        output: путь к директории пакета
+        segm_model: путь к .RAW файлу модели сегментации
+        segm_post: путь к .VEC файлу апостериорных вероятностей сегментации
+        segm_conf: путь к .CONF конфигурационному файлу сегментации
+        rec_model: путь к .MDL файлу модели распознавания
+        rec_graph: путь к .FST файлу общего графа распознавания
+        rec_words: путь к .TXT файлу текстового корпуса
+        rec_conf: путь к .CONF конфигурационному файлу распознавания
+        rec_iconf: путь к .CONF конфигурационному файлу векторного экстрактора
+        version: версия пакета (по умолчанию дата и время сборки)
+
+    Результат:
+        manifest: путь к файлу описания пакета
+    """
+    output = Path(output)
+    for directory in ('segmenter', 'recognizer'):
+        os.makedirs(str(output / directory), exist_ok=True)
+    shutil.copyfile(segm_model, str(output / SEGM_MODEL))
+    shutil.copyfile(segm_conf, str(output / SEGM_CONF))
+    sad_transform = NnetSAD.make_sad_transform(NnetSAD.read_average_posteriors(segm_post))
+    with xopen(str(output / SAD_TRANSFORM), 'w') as f:
+        sad_transform.write(f.stream(), True)
+    NnetSAD.make_sad_graph().write(str(output / SAD_GRAPH))
+
+    shutil.copyfile(rec_model, str(output / REC_MODEL))
+    shutil.copyfile(rec_conf, str(output / REC_CONF))
+    StdConstFst(read_fst_kaldi(rec_graph)).write(str(output / REC_GRAPH))
+    SymbolTable.read_text(rec_words).write(str(output / REC_WORDS))
+    copy_ivector_conf(rec_iconf, output)
+
+    files = sorted(str(path.relative_to(output)) for path in output.rglob('*') if path.is_file() and path.name != MANIFEST)
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'version': version or time.strftime('%Y%m%d-%H%M%S'),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'sources': {'segm_model': segm_model, 'segm_post': segm_post, 'segm_conf': segm_conf, 'rec_model': rec_model,
+                    'rec_graph': rec_graph, 'rec_words': rec_words, 'rec_conf': rec_conf, 'rec_iconf': rec_iconf},
+        'files': {name: {'sha256': get_checksum(str(output / name)), 'size': os.path.getsize(str(output / name))}
+                  for name in files}
+    }
+    with open(str(output / MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return str(output / MANIFEST)
+
+class Bundle(object):
+    """Класс пакета моделей сегментации и распознавания"""
+
+    def __init__(self, path, verify=False):
+        """
+        Открытие пакета моделей
+
+        Аргументы:
+            path: путь к директории пакета
+            verify: признак проверки контрольных сумм файлов (без него проверяются наличие и размер файлов)
+        """
+        self.path = Path(path).resolve()
+        with open(str(self.path / MANIFEST), 'r') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format') != BUNDLE_FORMAT:
+            raise ValueError("Неподдерживаемый формат пакета моделей: {}".format(self.manifest.get('format')))
+        self.version = self.manifest['version']
+        self.check(verify)
+        self.segm_conf = self.get(SEGM_CONF)
+        self.rec_conf = self.get(REC_CONF)
+        self.rec_iconf = self.resolve_ivector_conf()
+
+    def get(self, name):
+        return str(self.path / name)
+
+    def check(self, verify=False):
+        """
+        Проверка файлов пакета по описанию
+
+        Аргументы:
+            verify: признак проверки контрольных сумм
+        """
+        for name, info in self.manifest['files'].items():
+            path = self.get(name)
+            if not os.path.isfile(path) or os.path.getsize(path) != info['size']:
+                raise ValueError("Файл пакета моделей '{}' отсутствует или поврежден".format(name))
+            if verify and get_checksum(path) != info['sha256']:
+                raise ValueError("Контрольная сумма файла пакета моделей '{}' не совпадает".format(name))
+
+    def resolve_ivector_conf(self):
+        """
+        Формирование конфигурационного файла векторного экстрактора с абсолютными путями пакета
+
+        Результат:
+            iconf: путь к .CONF конфигурационному файлу векторного экстрактора
+        """
+        key = hashlib.sha1((str(self.path) + self.version).encode('utf-8')).hexdigest()[:12]
+        directory = Path(tempfile.gettempdir()) / ('stt_bundle_' + key)
+        os.makedirs(str(directory), exist_ok=True)
+        iconf = directory / Path(REC_ICONF).name
+        base = (self.path / REC_ICONF).parent
+        lines = []
+        with open(self.get(REC_ICONF), 'r') as f:
+            for line in f:
+                option, sep, value = line.strip().partition('=')
+                if sep and (base / value).is_file():
+                    value = str(base / value)
+                lines.append(option + sep + value)
+        temp = str(iconf) + '.' + str(os.getpid())
+        with open(temp, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(temp, str(iconf))
+        return str(iconf)
+
+    def load_segmenter(self):
+        """
+        Загрузка модели сегментации с предварительно рассчитанными преобразованием и графом
+
+        Результат:
+            model: модель сегментации
+            transform: матрица преобразования апостериорных вероятностей
+            graph: граф сегментации
+        """
+        model = NnetSAD.read_model(self.get(SEGM_MODEL))
+        transform = Matrix()
+        with xopen(self.get(SAD_TRANSFORM)) as f:
+            transform.read_(f.stream(), f.binary)
+        graph = StdVectorFst.read(self.get(SAD_GRAPH))
+        return model, transform, graph
+
+    def load_recognizer(self):
+        """
+        Загрузка модели распознавания, графа в формате ConstFst и бинарной таблицы символов
+
+        Результат:
+            transition_model: модель переходов
+            acoustic_model: акустическая модель
+            graph: граф распознавания
+            symbols: таблица символов
+        """
+        transition_model, acoustic_model = NnetLatticeFasterRecognizer.read_model(self.get(REC_MODEL))
+        graph = StdConstFst.read(self.get(REC_GRAPH))
+        symbols = SymbolTable.read(self.get(REC_WORDS))
+        return transition_model, acoustic_model, graph, symbols
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Утилита для сборки и проверки пакета моделей')
+    subparsers = parser.add_subparsers(dest='command')
+    build = subparsers.add_parser('build-bundle', help='Собрать пакет моделей')
+    build.add_argument('output', metavar='OUT', help='Путь к директории пакета моделей')
+    build.add_argument('-v', '--version', default=None, help='Версия пакета моделей')
+    build.add_argument('-rm', '--rec_model', default='model/final.mdl', help='Путь к .MDL файлу модели распознавания')
+    build.add_argument('-rg', '--rec_graph', default='model/HCLG.fst', help='Путь к .FST файлу общего графа распознавания')
+    build.add_argument('-rw', '--rec_words', default='model/words.txt', help='Путь к .TXT файлу текстового корпуса')
+    build.add_argument('-rc', '--rec_conf', default='model/conf/mfcc.conf', help='Путь к .CONF конфигурационному файлу распознавания')
+    build.add_argument('-ri', '--rec_iconf', default='model/conf/ivector_extractor.conf', help='Путь к .CONF конфигурационному файлу векторного экстрактора')
+    build.add_argument('-sm', '--segm_model', default='model/final.raw', help='Путь к .RAW файлу модели сегментации')
+    build.add_argument('-sc', '--segm_conf', default='model/conf/mfcc_hires.conf', help='Путь к .CONF конфигурационному файлу сегментации')
+    build.add_argument('-sp', '--segm_post', default='model/conf/post_output.vec', help='Путь к .VEC файлу апостериорных вероятностей сегментации')
+    verify = subparsers.add_parser('verify', help='Проверить контрольные суммы пакета моделей')
+    verify.add_argument('bundle', metavar='BUNDLE', help='Путь к директории пакета моделей')
+
+    args = parser.parse_args()
+
+    if args.command == 'build-bundle':
+        manifest = build_bundle(args.output, args.segm_model, args.segm_post, args.segm_conf, args.rec_model, args.rec_graph,
+                                args.rec_words, args.rec_conf, args.rec_iconf, args.version)
+        print("Пакет моделей собран: {}".format(manifest))
+    elif args.command == 'verify':
+        bundle = Bundle(args.bundle, verify=True)
+        print("Пакет моделей версии {} проверен".format(bundle.version))
+    else:
+        parser.print_help()
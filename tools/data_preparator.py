@@ -31,16 +31,19 @@ class DataPreparator(object):
             temp_dir: путь к директории с временными файлами
             ass_dir: путь к директории с файлами транскрибаций
             error_dir: путь к директории с .WAV файлами, которые не удалось распознать
+            processed_dir: путь к директории с распознанными .WAV файлами (если они не удаляются)
         """
         log_dir = self.output / 'logs'
         temp_dir = self.output / 'temp'
         ass_dir = self.output / 'ass'
         error_dir = self.output / 'error'
+        processed_dir = self.output / 'processed'
         os.makedirs(str(log_dir), exist_ok=True)
         os.makedirs(str(temp_dir), exist_ok=True)
         os.makedirs(str(ass_dir), exist_ok=True)
         os.makedirs(str(error_dir), exist_ok=True)
-        return log_dir, temp_dir, ass_dir, error_dir
+        os.makedirs(str(processed_dir), exist_ok=True)
+        return log_dir, temp_dir, ass_dir, error_dir, processed_dir
 
     def rename_wav(self, wav_files=None):
         """
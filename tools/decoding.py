@@ -0,0 +1,61 @@
+#!/usr/bin/python
+
+DEFAULT_PROFILE = 'balanced'
+
+DECODING_PROFILES = {
+    'fast': {
+        'beam': 10.0,
+        'lattice_beam': 6.0,
+        'max_active': 3000,
+        'acoustic_scale': 1.0,
+        'frames_per_chunk': 150,
+        'sad_frames_per_chunk': 300,
+        'sad_extra_left_context': 79,
+        'sad_extra_right_context': 21,
+        'sad_acoustic_scale': 0.3,
+    },
+    'balanced': {
+        'beam': 13.0,
+        'lattice_beam': 10.0,
+        'max_active': 7000,
+        'acoustic_scale': 1.0,
+        'frames_per_chunk': 50,
+        'sad_frames_per_chunk': 150,
+        'sad_extra_left_context': 79,
+        'sad_extra_right_context': 21,
+        'sad_acoustic_scale': 0.3,
+    },
+    'accurate': {
+        'beam': 16.0,
+        'lattice_beam': 10.0,
+        'max_active': 10000,
+        'acoustic_scale': 1.0,
+        'frames_per_chunk': 50,
+        'sad_frames_per_chunk': 150,
+        'sad_extra_left_context': 79,
+        'sad_extra_right_context': 21,
+        'sad_acoustic_scale': 0.3,
+    },
+}
+
+def get_profile(name=None, options=None):
+    """
+    Получение параметров декодирования по названию профиля
+
+    Аргументы:
+        name: название профиля (fast, balanced, accurate)
+        options: словарь параметров, переопределяющих значения профиля
+
+    Результат:
+        profile: словарь параметров декодирования
+    """
+    name = name or DEFAULT_PROFILE
+    if name not in DECODING_PROFILES:
+        raise ValueError("Неизвестный профиль декодирования '{}'".format(name))
+    profile = dict(DECODING_PROFILES[name])
+    for key, value in (options or {}).items():
+        if key not in profile:
+            raise ValueError("Неизвестный параметр декодирования '{}'".format(key))
+        if value is not None:
+            profile[key] = value
+    return profile
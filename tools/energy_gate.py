@@ -0,0 +1,115 @@
+#!/usr/bin/python
+import argparse
+from pathlib import Path
+import numpy as np
+import soundfile
+
+class EnergyGate(object):
+    """Класс для отсева тихих каналов и продолжительных пауз по энергии кадров до сегментации"""
+
+    def __init__(self, threshold=-45.0, min_active=0.005, min_silence=3.0, padding=1.0, frame=0.05):
+        """
+        Инициализация фильтра
+
+        Аргументы:
+            threshold: порог энергии кадра в дБ относительно полной шкалы
+            min_active: минимальная доля кадров выше порога, при которой канал не отбрасывается
+            min_silence: минимальная длительность паузы в секундах, исключаемой из сегментации
+            padding: длительность в секундах, сохраняемая вокруг кадров выше порога
+            frame: длительность кадра в секундах
+        """
+        self.threshold = threshold
+        self.min_active = min_active
+        self.min_silence = min_silence
+        self.padding = padding
+        self.frame = frame
+
+    def frame_energy(self, wav):
+        """
+        Расчет энергии кадров по каналам с ограниченным потреблением памяти
+
+        Аргументы:
+            wav: путь к .WAV файлу аудио
+
+        Результат:
+            energy: матрица энергии кадров в дБ (кадры x каналы)
+            duration: длительность аудио в секундах
+        """
+        info = soundfile.info(wav)
+        frame_length = max(int(round(info.samplerate * self.frame)), 1)
+        blocksize = frame_length * 2000
+        energy = []
+        for block in soundfile.blocks(wav, blocksize=blocksize, dtype='float32', always_2d=True):
+            frames = len(block) // frame_length
+            if frames == 0:
+                continue
+            block = block[:frames * frame_length].reshape(frames, frame_length, -1)
+            energy.append(10 * np.log10(np.mean(block ** 2, axis=1) + 1e-10))
+        energy = np.concatenate(energy) if energy else np.zeros((0, info.channels))
+        return energy, info.frames / info.samplerate
+
+    def find_regions(self, active):
+        """
+        Формирование интервалов аудио, передаваемых в сегментацию
+
+        Аргументы:
+            active: признаки кадров выше порога энергии
+
+        Результат:
+            regions: список интервалов (начальный кадр, конечный кадр)
+        """
+        if not active.any() or active.mean() < self.min_active:
+            return []
+        pad = int(round(self.padding / self.frame))
+        if pad:
+            active = np.convolve(active, np.ones(2 * pad + 1), mode='same') > 0
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], active.astype(np.int8), [0]])))
+        starts, ends = list(edges[::2]), list(edges[1::2])
+        min_gap = int(round(self.min_silence / self.frame))
+        regions = [[starts[0], ends[0]]]
+        for start, end in zip(starts[1:], ends[1:]):
+            if start - regions[-1][1] < min_gap:
+                regions[-1][1] = end
+            else:
+                regions.append([start, end])
+        return [tuple(region) for region in regions]
+
+    def detect(self, wav):
+        """
+        Поиск интервалов с возможной речью по каналам
+
+        Аргументы:
+            wav: путь к .WAV файлу аудио
+
+        Результат:
+            regions: словарь интервалов (начало, конец) в секундах по идентификаторам каналов
+            skipped: доля аудио, исключенного из сегментации
+        """
+        energy, duration = self.frame_energy(wav)
+        regions = {}
+        kept = 0.0
+        for channel in range(energy.shape[1]):
+            key = Path(wav).stem + '.' + str(channel)
+            regions[key] = [(float(start * self.frame), float(min(end * self.frame, duration)))
+                            for start, end in self.find_regions(energy[:, channel] > self.threshold)]
+            kept += sum(end - start for start, end in regions[key])
+        total = duration * energy.shape[1]
+        skipped = float(1 - kept / total) if total else 0.0
+        return regions, skipped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Утилита для поиска тихих каналов и пауз в аудио')
+    parser.add_argument('wav', metavar='WAV', help='Путь к .WAV файлу аудио')
+    parser.add_argument('-t', '--threshold', default=-45.0, type=float, help='Порог энергии кадра в дБ')
+    parser.add_argument('-a', '--min_active', default=0.005, type=float, help='Минимальная доля кадров выше порога в канале')
+    parser.add_argument('-s', '--min_silence', default=3.0, type=float, help='Минимальная длительность исключаемой паузы в секундах')
+    parser.add_argument('-p', '--padding', default=1.0, type=float, help='Длительность, сохраняемая вокруг речи, в секундах')
+
+    args = parser.parse_args()
+
+    gate = EnergyGate(args.threshold, args.min_active, args.min_silence, args.padding)
+    regions, skipped = gate.detect(args.wav)
+    for key, intervals in regions.items():
+        print(key, ' '.join('{:.2f}-{:.2f}'.format(start, end) for start, end in intervals) or '-')
+    print("Доля исключенного аудио: {:.1%}".format(skipped))
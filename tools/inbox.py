@@ -0,0 +1,212 @@
+#!/usr/bin/python
+import argparse
+import os
+import time
+import glob
+import socket
+import shutil
+import logging
+import threading
+from pathlib import Path
+from tools.utils import LOGGER_NAME
+
+CLAIMS_DIR = '.claims'
+LEASE_FILE = '.lease'
+TOMBSTONE_PREFIX = '.removed-'
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+class Inbox(object):
+    """Класс для распределения .WAV файлов общей директории между несколькими узлами обработки"""
+
+    def __init__(self, wav, node=None, lease_timeout=300, heartbeat=None):
+        """
+        Инициализация входящей директории
+
+        Аргументы:
+            wav: путь к .WAV файлам аудио
+            node: уникальное наименование узла обработки (по умолчанию имя хоста и идентификатор процесса)
+            lease_timeout: время в секундах без обновления аренды, после которого захваченные узлом файлы
+                           возвращаются во входящую директорию
+            heartbeat: период обновления аренды в секундах (по умолчанию десятая часть lease_timeout)
+        """
+        self.wav = Path(wav)
+        self.node = node or '{}-{}'.format(socket.gethostname(), os.getpid())
+        self.lease_timeout = lease_timeout
+        self.heartbeat = heartbeat or max(lease_timeout / 10, 1)
+        self.claims = self.wav / CLAIMS_DIR
+        self.claim_dir = self.claims / self.node
+        self.lease = self.claim_dir / LEASE_FILE
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.keep_alive, daemon=True)
+
+    def start(self):
+        """
+        Регистрация узла: возврат файлов, оставшихся от предыдущего запуска узла, и запуск обновления аренды
+        """
+        os.makedirs(str(self.claim_dir), exist_ok=True)
+        self.touch()
+        self.restore(self.claim_dir, remove=False)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Остановка обновления аренды и возврат оставшихся файлов узла во входящую директорию"""
+        self.stopped.set()
+        self.restore(self.claim_dir)
+
+    def touch(self):
+        """
+        Обновление аренды узла; если директория узла удалена другим узлом, посчитавшим аренду
+        истекшей, она создается повторно
+        """
+        try:
+            with open(str(self.lease), 'a'):
+                os.utime(str(self.lease), None)
+        except FileNotFoundError:
+            LOGGER.warning("Аренда узла '{}' истекла и захваченные файлы возвращены другим узлом, "
+                           "директория узла создана повторно".format(self.node))
+            os.makedirs(str(self.claim_dir), exist_ok=True)
+            with open(str(self.lease), 'a'):
+                os.utime(str(self.lease), None)
+
+    def keep_alive(self):
+        while not self.stopped.wait(self.heartbeat):
+            try:
+                self.touch()
+            except OSError as e:
+                LOGGER.warning("Не удалось обновить аренду узла '{}': {}".format(self.node, e))
+
+    def restore(self, claim_dir, remove=True):
+        """
+        Возврат захваченных файлов во входящую директорию; перед удалением директория узла
+        атомарно переименовывается, поэтому файлы, захваченные узлом после повторного создания
+        его директории, не удаляются
+
+        Аргументы:
+            claim_dir: путь к директории захваченных файлов узла
+            remove: признак удаления директории узла
+
+        Результат:
+            restored: количество возвращенных файлов
+        """
+        if remove:
+            tombstone = self.claims / '{}{}-{}-{}'.format(TOMBSTONE_PREFIX, claim_dir.name, self.node, time.time())
+            try:
+                os.rename(str(claim_dir), str(tombstone))
+            except OSError:
+                return 0
+            claim_dir = tombstone
+        restored = 0
+        for wav in glob.glob(str(claim_dir / '*.wav')):
+            try:
+                os.rename(wav, str(self.wav / Path(wav).name))
+                restored += 1
+            except OSError:
+                pass
+        if remove:
+            shutil.rmtree(str(claim_dir), ignore_errors=True)
+        return restored
+
+    @staticmethod
+    def get_updated(claim_dir):
+        """
+        Время последнего обновления аренды узла
+
+        Аргументы:
+            claim_dir: путь к директории захваченных файлов узла
+
+        Результат:
+            updated: время изменения файла аренды (при его отсутствии - директории узла) или None,
+                     если директория узла уже удалена
+        """
+        for path in (claim_dir / LEASE_FILE, claim_dir):
+            try:
+                return path.stat().st_mtime
+            except OSError:
+                continue
+        return None
+
+    def reclaim(self):
+        """
+        Возврат во входящую директорию файлов узлов, аренда которых не обновлялась дольше lease_timeout
+
+        Результат:
+            reclaimed: словарь количества возвращенных файлов по наименованиям узлов
+        """
+        reclaimed = {}
+        now = time.time()
+        for claim_dir in self.claims.glob('*'):
+            if claim_dir.name == self.node or not claim_dir.is_dir():
+                continue
+            updated = self.get_updated(claim_dir)
+            if updated is not None and now - updated > self.lease_timeout:
+                reclaimed[claim_dir.name] = self.restore(claim_dir)
+        return reclaimed
+
+    def claim(self, limit=None, delta=None):
+        """
+        Захват .WAV файлов входящей директории атомарным переносом в директорию узла в порядке
+        их изменения; файлы, перенесенные другими узлами во время захвата, пропускаются;
+        пробелы в наименованиях файлов заменяются под формат Kaldi
+
+        Аргументы:
+            limit: максимальное количество захватываемых файлов или None
+            delta: минимальное время в секундах с момента изменения файла или None
+
+        Результат:
+            wavs: список путей к захваченным .WAV файлам
+        """
+        self.touch()
+        candidates = []
+        for wav in glob.glob(str(self.wav / '*.wav')):
+            try:
+                candidates.append((os.path.getmtime(wav), wav))
+            except OSError:
+                continue
+        wavs = []
+        for updated, wav in sorted(candidates):
+            if limit and len(wavs) >= limit:
+                break
+            if delta and time.time() - updated <= delta:
+                continue
+            try:
+                claimed = str(self.claim_dir / Path(wav).name.replace(' ', '_'))
+                os.rename(wav, claimed)
+            except OSError:
+                continue
+            wavs.append(claimed)
+        return wavs
+
+    def status(self):
+        """
+        Состояние узлов обработки
+
+        Результат:
+            nodes: словарь кортежей (время с последнего обновления аренды в секундах, количество
+                   захваченных файлов) по наименованиям узлов
+        """
+        nodes = {}
+        now = time.time()
+        for claim_dir in self.claims.glob('*'):
+            updated = self.get_updated(claim_dir)
+            if updated is None or claim_dir.name.startswith(TOMBSTONE_PREFIX):
+                continue
+            nodes[claim_dir.name] = (now - updated, len(glob.glob(str(claim_dir / '*.wav'))))
+        return nodes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Утилита для просмотра и освобождения захватов общей входящей директории')
+    parser.add_argument('wav', metavar='WAV', help='Путь к .WAV файлам аудио')
+    parser.add_argument('-lx', '--lease_timeout', default=300, type=int,
+                        help='Время без обновления аренды в секундах, после которого файлы узла возвращаются')
+    parser.add_argument('-r', '--reclaim', dest='reclaim', action='store_true', help='Вернуть файлы узлов с истекшей арендой')
+
+    args = parser.parse_args()
+
+    inbox = Inbox(args.wav, lease_timeout=args.lease_timeout)
+    if args.reclaim:
+        for node, count in inbox.reclaim().items():
+            print("Возвращено {} файлов узла '{}'".format(count, node))
+    for node, (age, count) in inbox.status().items():
+        print(node, '{:.0f} с'.format(age), count)
@@ -0,0 +1,276 @@
+#!/usr/bin/python
+import time
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+RTF_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+
+def format_labels(names, values):
+    """
+    Формирование строки меток в формате Prometheus
+
+    Аргументы:
+        names: названия меток
+        values: значения меток
+
+    Результат:
+        labels: строка меток
+    """
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append('{}="{}"'.format(name, value))
+    return '{' + ','.join(pairs) + '}'
+
+class Metric(object):
+    """Базовый класс метрики"""
+
+    kind = None
+
+    def __init__(self, name, description, labels=()):
+        """
+        Инициализация метрики
+
+        Аргументы:
+            name: название метрики
+            description: описание метрики
+            labels: названия меток
+        """
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def header(self):
+        return ['# HELP {} {}'.format(self.name, self.description),
+                '# TYPE {} {}'.format(self.name, self.kind)]
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append('{}{} {}'.format(self.name, format_labels(self.labels, key), value))
+        return lines
+
+class Counter(Metric):
+    """Класс монотонно возрастающего счетчика"""
+
+    kind = 'counter'
+
+    def inc(self, value=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+class Gauge(Metric):
+    """Класс метрики текущего значения"""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def inc(self, value=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def dec(self, value=1, **labels):
+        self.inc(-value, **labels)
+
+class Histogram(Metric):
+    """Класс гистограммы распределения значений"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=DURATION_BUCKETS):
+        """
+        Инициализация гистограммы
+
+        Аргументы:
+            name: название метрики
+            description: описание метрики
+            labels: названия меток
+            buckets: верхние границы интервалов
+        """
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    lines.append('{}_bucket{} {}'.format(self.name, format_labels(self.labels + ('le',), key + (le,)), count))
+                lines.append('{}_sum{} {}'.format(self.name, format_labels(self.labels, key), total))
+                lines.append('{}_count{} {}'.format(self.name, format_labels(self.labels, key), counts[-1]))
+        return lines
+
+class Registry(object):
+    """Класс реестра метрик пайплайна распознавания"""
+
+    def __init__(self):
+        """Инициализация реестра и метрик пайплайна"""
+        self.metrics = []
+        self.stage_duration = self.register(Histogram(
+            'stt_stage_duration_seconds', 'Длительность этапа пайплайна', ['stage']))
+        self.audio_duration = self.register(Counter(
+            'stt_audio_duration_seconds_total', 'Суммарная длительность обработанного аудио'))
+        self.skipped_duration = self.register(Counter(
+            'stt_audio_skipped_seconds_total', 'Длительность аудио, исключенного энергетическим фильтром до сегментации'))
+        self.processing_duration = self.register(Counter(
+            'stt_processing_duration_seconds_total', 'Суммарное время обработки аудио'))
+        self.real_time_factor = self.register(Histogram(
+            'stt_file_real_time_factor', 'Отношение времени обработки файла к длительности аудио', buckets=RTF_BUCKETS))
+        self.files = self.register(Counter(
+            'stt_files_processed_total', 'Количество обработанных файлов', ['status']))
+        self.errors = self.register(Counter(
+            'stt_stage_errors_total', 'Количество ошибок по этапам пайплайна', ['stage']))
+        self.queue_depth = self.register(Gauge(
+            'stt_queue_depth', 'Количество файлов, ожидающих обработки'))
+        self.active_workers = self.register(Gauge(
+            'stt_active_workers', 'Количество активных процессов обработки'))
+        self.worker_restarts = self.register(Counter(
+            'stt_worker_restarts_total', 'Количество принудительно завершенных процессов обработки', ['reason']))
+        self.cache_requests = self.register(Counter(
+            'stt_model_cache_requests_total', 'Количество обращений к кэшу моделей', ['model', 'result']))
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def record(self, stats):
+        """
+        Учет статистики обработки файла
+
+        Аргументы:
+            stats: статистика обработки файла (PipelineStats)
+        """
+        for stage, duration in stats.stages.items():
+            self.stage_duration.observe(duration, stage=stage)
+        processing = sum(stats.stages.values())
+        self.processing_duration.inc(processing)
+        if stats.duration:
+            self.audio_duration.inc(stats.duration)
+            self.skipped_duration.inc(stats.skipped * stats.duration)
+            self.real_time_factor.observe(processing / stats.duration)
+        if stats.error:
+            self.errors.inc(stage=stats.error)
+        self.files.inc(status='error' if stats.error else 'ok')
+        for (model, result), count in stats.cache.items():
+            self.cache_requests.inc(count, model=model, result=result)
+
+    def render(self):
+        """
+        Формирование текстового представления метрик в формате Prometheus
+
+        Результат:
+            text: текст метрик
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+class PipelineStats(object):
+    """Класс статистики обработки одного файла"""
+
+    def __init__(self, wav, duration=0.0, listener=None):
+        """
+        Инициализация статистики
+
+        Аргументы:
+            wav: наименование аудио файла
+            duration: длительность аудио в секундах
+            listener: функция, вызываемая с наименованием этапа при его начале, или None
+        """
+        self.wav = wav
+        self.duration = duration
+        self.listener = listener
+        self.stages = {}
+        self.error = None
+        self.skipped = 0.0
+        self.cache = {}
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Замер длительности этапа; при исключении этап помечается как ошибочный
+
+        Аргументы:
+            name: наименование этапа
+        """
+        if self.listener:
+            self.listener(name)
+        start = time.perf_counter()
+        try:
+            yield
+        except:
+            self.error = name
+            raise
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def cache_request(self, model, hit):
+        key = (model, 'hit' if hit else 'miss')
+        self.cache[key] = self.cache.get(key, 0) + 1
+
+class MetricsExporter(object):
+    """Класс HTTP-экспортера метрик для режима пакетной обработки"""
+
+    def __init__(self, registry, port, host='0.0.0.0'):
+        """
+        Инициализация экспортера
+
+        Аргументы:
+            registry: реестр метрик
+            port: порт HTTP-сервера
+            host: адрес HTTP-сервера
+        """
+        self.registry = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split('?')[0] != '/metrics':
+                    handler.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                handler.send_response(200)
+                handler.send_header('Content-Type', CONTENT_TYPE)
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
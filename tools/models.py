@@ -0,0 +1,92 @@
+#!/usr/bin/python
+import threading
+from contextlib import contextmanager
+from tools.segmenter import Segmenter
+from tools.recognizer import Recognizer
+
+class ModelCache(object):
+    """Класс кэша загруженных моделей в рамках одного процесса с последовательным доступом к каждой модели"""
+
+    def __init__(self):
+        """Инициализация кэша моделей"""
+        self.models = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def get(self, name, key, factory, stats=None):
+        """
+        Получение модели из кэша или ее загрузка
+
+        Аргументы:
+            name: наименование модели
+            key: ключ параметров модели
+            factory: функция загрузки модели
+            stats: статистика обработки файла (PipelineStats)
+
+        Результат:
+            model: объект модели
+            lock: блокировка, которую необходимо удерживать на время использования модели
+        """
+        with self.lock:
+            hit = (name, key) in self.models
+            if not hit:
+                self.models[(name, key)] = factory()
+                self.locks[(name, key)] = threading.Lock()
+        if stats is not None:
+            stats.cache_request(name, hit)
+        return self.models[(name, key)], self.locks[(name, key)]
+
+    @contextmanager
+    def use_segmenter(self, model, post, conf, profile=None, stats=None, bundle=None):
+        """
+        Монопольное использование сегментатора; пути к файлам обрабатываемого аудио передаются
+        в методы segment и extract_segments
+
+        Аргументы:
+            model: путь к .RAW файлу модели сегментации
+            post: путь к .VEC файлу апостериорных вероятностей сегментации
+            conf: путь к .CONF конфигурационному файлу сегментации
+            profile: название профиля декодирования
+            stats: статистика обработки файла (PipelineStats)
+            bundle: пакет моделей (Bundle) или None
+
+        Результат:
+            segmenter: объект сегментатора
+        """
+        key = (bundle.path, bundle.version) if bundle is not None else (model, post, conf)
+        segm, lock = self.get('segmenter', key + (profile,),
+                              lambda: Segmenter(None, model, post, conf, None, profile=profile, bundle=bundle), stats)
+        with lock:
+            yield segm
+
+    @contextmanager
+    def use_recognizer(self, model, graph, words, conf, iconf, profile=None, lattice=False, batch_size=None,
+                       stats=None, bundle=None):
+        """
+        Монопольное использование распознавателя; пути к файлам обрабатываемого аудио передаются
+        в метод recognize, а при смене профиля декодирования распознаватель перенастраивается
+        без повторной загрузки модели и графа
+
+        Аргументы:
+            model: путь к .MDL файлу модели распознавания
+            graph: путь к .FST файлу общего графа распознавания
+            words: путь к .TXT файлу текстового корпуса
+            conf: путь к .CONF конфигурационному файлу распознавания
+            iconf: путь к .CONF конфигурационному файлу векторного экстрактора
+            profile: название профиля декодирования
+            lattice: признак генерации решеток
+            batch_size: размер минипакета для пакетного вычисления нейросети
+            stats: статистика обработки файла (PipelineStats)
+            bundle: пакет моделей (Bundle) или None
+
+        Результат:
+            recognizer: объект распознавателя
+        """
+        key = (bundle.path, bundle.version) if bundle is not None else (model, graph, words, conf, iconf)
+        rec, lock = self.get('recognizer', key + (lattice, batch_size),
+                             lambda: Recognizer(None, model, graph, words, conf, iconf, None, None, profile=profile,
+                                                lattice=lattice, batch_size=batch_size, bundle=bundle), stats)
+        with lock:
+            if rec.profile_name != profile:
+                rec.configure(profile)
+            yield rec
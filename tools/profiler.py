@@ -0,0 +1,320 @@
+#!/usr/bin/python
+import os
+import sys
+import glob
+import pstats
+import cProfile
+import argparse
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from collections import defaultdict
+
+MODES = ['cprofile', 'sample']
+CHILDREN_SUFFIX = '.children'
+CLOCK_TICK = 1.0 / os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 0.01
+
+def get_descendants(pid):
+    """
+    Получение идентификаторов всех дочерних процессов
+
+    Аргументы:
+        pid: идентификатор процесса
+
+    Результат:
+        descendants: список идентификаторов дочерних процессов
+    """
+    descendants = []
+    stack = [pid]
+    while stack:
+        parent = stack.pop()
+        for children in glob.glob('/proc/{}/task/*/children'.format(parent)):
+            try:
+                with open(children, 'r') as f:
+                    pids = [int(child) for child in f.read().split()]
+            except (OSError, ValueError):
+                continue
+            descendants.extend(pids)
+            stack.extend(pids)
+    return descendants
+
+def read_cpu(path):
+    """
+    Чтение имени и процессорного времени из файла stat процесса или потока
+
+    Аргументы:
+        path: путь к файлу stat
+
+    Результат:
+        comm: имя исполняемого файла процесса или потока
+        cpu: процессорное время (utime + stime) в секундах
+    """
+    with open(path, 'r') as f:
+        stat = f.read()
+    comm = stat[stat.index('(') + 1:stat.rindex(')')]
+    fields = stat[stat.rindex(')') + 2:].split()
+    return comm, (int(fields[11]) + int(fields[12])) * CLOCK_TICK
+
+def get_process_cpu(pid):
+    """
+    Получение имени и процессорного времени процесса
+
+    Аргументы:
+        pid: идентификатор процесса
+
+    Результат:
+        comm: имя исполняемого файла процесса
+        cpu: процессорное время процесса в секундах
+    """
+    return read_cpu('/proc/{}/stat'.format(pid))
+
+def get_thread_cpu(native_id):
+    """
+    Получение процессорного времени потока текущего процесса
+
+    Аргументы:
+        native_id: системный идентификатор потока
+
+    Результат:
+        cpu: процессорное время потока в секундах
+    """
+    return read_cpu('/proc/self/task/{}/stat'.format(native_id))[1]
+
+def format_frame(frame):
+    code = frame.f_code
+    return '{} ({}:{})'.format(code.co_name, Path(code.co_filename).name, code.co_firstlineno)
+
+class Sampler(threading.Thread):
+    """
+    Класс потока, собирающего стеки вызовов и загрузку дочерних процессов; стеки Python
+    взвешиваются процессорным временем профилируемого потока, поэтому ожидание дочерних
+    процессов не учитывается повторно в кадрах [comm]
+    """
+
+    def __init__(self, name, thread_id, interval, python_stacks=True, thread_native_id=None):
+        """
+        Инициализация сэмплера
+
+        Аргументы:
+            name: наименование корневого кадра (аудио файла)
+            thread_id: идентификатор профилируемого потока
+            interval: интервал сэмплирования в секундах
+            python_stacks: признак сбора стеков Python
+            thread_native_id: системный идентификатор профилируемого потока (без него стеки Python
+                              взвешиваются интервалом сэмплирования)
+        """
+        super().__init__(daemon=True)
+        self.name_root = name
+        self.thread_id = thread_id
+        self.thread_native_id = thread_native_id
+        self.interval = interval
+        self.python_stacks = python_stacks
+        self.stacks = defaultdict(int)
+        self.cpu = {}
+        self.thread_cpu = self.get_thread_cpu()
+        self.finished = threading.Event()
+
+    def get_thread_cpu(self):
+        if self.thread_native_id is None:
+            return None
+        try:
+            return get_thread_cpu(self.thread_native_id)
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def get_python_weight(self):
+        cpu = self.get_thread_cpu()
+        if cpu is None or self.thread_cpu is None:
+            return int(self.interval * 1000)
+        delta, self.thread_cpu = cpu - self.thread_cpu, cpu
+        return int(delta * 1000)
+
+    def current_stack(self):
+        frame = sys._current_frames().get(self.thread_id)
+        frames = []
+        while frame is not None:
+            frames.append(format_frame(frame))
+            frame = frame.f_back
+        return [self.name_root] + frames[::-1]
+
+    def sample(self, final=False):
+        stack = self.current_stack()
+        if self.python_stacks and not final:
+            weight = self.get_python_weight()
+            if weight > 0:
+                self.stacks[';'.join(stack)] += weight
+        for pid in get_descendants(os.getpid()):
+            try:
+                comm, cpu = get_process_cpu(pid)
+            except (OSError, ValueError, IndexError):
+                continue
+            delta = cpu - self.cpu.get(pid, 0.0)
+            self.cpu[pid] = cpu
+            if delta > 0:
+                self.stacks[';'.join(stack + ['[' + comm + ']'])] += int(delta * 1000)
+
+    def run(self):
+        while not self.finished.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self.finished.set()
+        self.join()
+        self.sample(final=True)
+
+class Profiler(object):
+    """Класс профилирования пайплайна распознавания по файлам"""
+
+    def __init__(self, mode, output, interval=0.01):
+        """
+        Инициализация профилировщика
+
+        Аргументы:
+            mode: режим профилирования (cprofile, sample) или None для отключения
+            output: путь к директории с результатами профилирования
+            interval: интервал сэмплирования в секундах
+        """
+        if mode and mode not in MODES:
+            raise ValueError("Неизвестный режим профилирования '{}'".format(mode))
+        self.mode = mode
+        self.output = Path(output)
+        self.interval = interval
+
+    @contextmanager
+    def profile(self, name):
+        """
+        Профилирование обработки одного файла; результаты записываются в поддиректорию процесса
+        в виде .COLLAPSED файла (режим sample) или .PROF файла и .CHILDREN файла процессорного времени
+        дочерних процессов (режим cprofile: время ожидания дочерних процессов уже учтено cProfile,
+        поэтому оно не объединяется со стеками вызовов)
+
+        Аргументы:
+            name: наименование аудио файла
+        """
+        if not self.mode:
+            yield
+            return
+        output = self.output / str(os.getpid())
+        os.makedirs(str(output), exist_ok=True)
+        sampler = Sampler(name, threading.get_ident(), self.interval, self.mode == 'sample', threading.get_native_id())
+        profiler = cProfile.Profile() if self.mode == 'cprofile' else None
+        sampler.start()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(str(output / (name + '.prof')))
+            sampler.stop()
+            suffix = '.collapsed' if self.mode == 'sample' else CHILDREN_SUFFIX
+            with open(str(output / (name + suffix)), 'w') as f:
+                for stack, weight in sorted(sampler.stacks.items()):
+                    if weight:
+                        f.write('{} {}\n'.format(stack, weight))
+
+def pstats_to_collapsed(stats, max_depth=64):
+    """
+    Преобразование статистики cProfile в свернутые стеки вызовов;
+    собственное время функции распределяется по вызывающим функциям
+    пропорционально их накопленному времени, ветви весом менее 0.01 мс отбрасываются
+
+    Аргументы:
+        stats: объект pstats.Stats
+        max_depth: максимальная глубина стека
+
+    Результат:
+        stacks: словарь свернутых стеков с весами в миллисекундах
+    """
+    def name(func):
+        return '{} ({}:{})'.format(func[2], Path(func[0]).name, func[1])
+
+    stacks = defaultdict(float)
+
+    def walk(func, path, weight, visited):
+        if weight < 0.01:
+            return
+        callers = stats.stats[func][4] if func in stats.stats else {}
+        callers = {caller: edge for caller, edge in callers.items() if caller not in visited}
+        total = sum(edge[3] for edge in callers.values())
+        if not callers or total <= 0 or len(path) >= max_depth:
+            stacks[';'.join(name(f) for f in reversed(path))] += weight
+            return
+        for caller, edge in callers.items():
+            walk(caller, path + [caller], weight * edge[3] / total, visited | {caller})
+
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        if tt > 0:
+            walk(func, [func], tt * 1000, {func})
+    return stacks
+
+def read_collapsed(directory, pattern, stacks):
+    """
+    Суммирование весов свернутых стеков вызовов из файлов директории
+
+    Аргументы:
+        directory: путь к директории с результатами профилирования
+        pattern: шаблон наименований файлов
+        stacks: словарь свернутых стеков с весами, в который добавляются веса
+    """
+    for collapsed_file in sorted(glob.glob(str(Path(directory) / '**' / pattern), recursive=True)):
+        with open(collapsed_file, 'r') as f:
+            for line in f:
+                stack, _, weight = line.rstrip('\n').rpartition(' ')
+                if stack:
+                    stacks[stack] += float(weight)
+
+def write_collapsed(stacks, collapsed):
+    with open(collapsed, 'w') as f:
+        for stack, weight in sorted(stacks.items()):
+            if int(weight):
+                f.write('{} {}\n'.format(stack, int(weight)))
+    return collapsed
+
+def merge_profiles(directory, output):
+    """
+    Объединение профилей всех процессов в один профиль; процессорное время дочерних процессов
+    режима cprofile записывается в отдельный файл, так как время их ожидания уже входит в профиль cProfile
+
+    Аргументы:
+        directory: путь к директории с результатами профилирования
+        output: путь к результирующим файлам без расширения
+
+    Результат:
+        collapsed: путь к .COLLAPSED файлу для построения flame graph
+        prof: путь к объединенному .PROF файлу или None
+        children: путь к .COLLAPSED файлу процессорного времени дочерних процессов режима cprofile или None
+    """
+    stacks = defaultdict(float)
+    read_collapsed(directory, '*.collapsed', stacks)
+    children = defaultdict(float)
+    read_collapsed(directory, '*' + CHILDREN_SUFFIX, children)
+    prof = None
+    prof_files = sorted(glob.glob(str(Path(directory) / '**' / '*.prof'), recursive=True))
+    if prof_files:
+        merged = pstats.Stats(prof_files[0])
+        for prof_file in prof_files[1:]:
+            merged.add(prof_file)
+        prof = output + '.prof'
+        merged.dump_stats(prof)
+        for stack, weight in pstats_to_collapsed(merged).items():
+            stacks[stack] += weight
+    collapsed = write_collapsed(stacks, output + '.collapsed')
+    children = write_collapsed(children, output + CHILDREN_SUFFIX + '.collapsed') if children else None
+    return collapsed, prof, children
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Утилита для объединения профилей процессов распознавания')
+    parser.add_argument('profiles', metavar='DIR', help='Путь к директории с результатами профилирования')
+    parser.add_argument('output', metavar='OUT', help='Путь к результирующим файлам без расширения')
+
+    args = parser.parse_args()
+
+    collapsed, prof, children = merge_profiles(args.profiles, args.output)
+    print("Свернутые стеки вызовов: {}".format(collapsed))
+    if prof:
+        print("Объединенный профиль cProfile: {}".format(prof))
+    if children:
+        print("Процессорное время дочерних процессов: {}".format(children))
@@ -2,15 +2,27 @@
 import argparse
 from pathlib import Path
 import logging
-from kaldi.asr import NnetLatticeFasterRecognizer
+from kaldi.asr import NnetLatticeFasterRecognizer, MappedLatticeFasterRecognizer
 from kaldi.decoder import LatticeFasterDecoderOptions
+from kaldi.fstext import SymbolTable, read_fst_kaldi
+from kaldi.matrix import Matrix
 from kaldi.nnet3 import NnetSimpleComputationOptions
 from kaldi.util.table import SequentialMatrixReader, CompactLatticeWriter
+from tools.decoding import get_profile, DECODING_PROFILES
+from tools.utils import LOGGER_NAME
+try:
+    from kaldi.nnet3 import NnetBatchComputerOptions, NnetBatchInference
+except ImportError:
+    NnetBatchComputerOptions = NnetBatchInference = None
+
+ONLINE_IVECTOR_PERIOD = 10
+LOGGER = logging.getLogger(LOGGER_NAME)
 
 class Recognizer(object):
     """Класс для распознавания речи с помощью алгоритма nnet3"""
 
-    def __init__(self, scp, model, graph, words, conf, iconf, spk2utt, output, printed=False, log=False):
+    def __init__(self, scp, model, graph, words, conf, iconf, spk2utt, output, printed=False, log=False, 
+                profile=None, options=None, lattice=False, batch_size=None, bundle=None):
         """
         Инициализация транскриптора
         
@@ -25,6 +37,13 @@ class Recognizer(object):
             output: путь к директории с результатами распознавания
             printed: признак печати результатов распознавания
             log: признак логирования
+            profile: название профиля декодирования (fast, balanced, accurate)
+            options: словарь параметров, переопределяющих значения профиля
+            lattice: признак генерации решеток (без него выполняется поиск только лучшего пути 
+                     без детерминизации решеток)
+            batch_size: размер минипакета чанков для пакетного вычисления нейросети по всем сегментам 
+                        или None для вычисления по одному сегменту
+            bundle: пакет моделей (Bundle), заменяющий model, graph, words, conf и iconf, или None
         """  
         self.scp = scp
         self.model = model
@@ -33,48 +52,173 @@ class Recognizer(object):
         self.conf = conf
         self.iconf = iconf
         self.spk2utt = spk2utt
-        self.output = Path(output)
+        self.output = Path(output) if output else None
         self.printed = printed
         self.log = log
+        self.lattice = lattice
+        self.batch_size = batch_size
+        if batch_size and NnetBatchInference is None:
+            LOGGER.warning("Пакетное вычисление нейросети не поддерживается установленной версией pykaldi")
+            self.batch_size = None
+
+        if bundle is not None:
+            self.conf = bundle.rec_conf
+            self.iconf = bundle.rec_iconf
+            self.transition_model, self.acoustic_model, self.decoding_graph, self.symbols = bundle.load_recognizer()
+        else:
+            self.transition_model, self.acoustic_model = NnetLatticeFasterRecognizer.read_model(self.model)
+            self.decoding_graph = read_fst_kaldi(self.graph)
+            self.symbols = SymbolTable.read_text(self.words)
+        self.configure(profile, options)
 
+    def configure(self, profile=None, options=None):
+        """
+        Настройка параметров декодирования без повторной загрузки модели и графа
+        
+        Аргументы:
+            profile: название профиля декодирования (fast, balanced, accurate)
+            options: словарь параметров, переопределяющих значения профиля
+        """
+        self.profile_name = profile
+        self.profile = get_profile(profile, options)
         decoder_opts = LatticeFasterDecoderOptions()
-        decoder_opts.beam = 13
-        decoder_opts.max_active = 7000
+        decoder_opts.beam = self.profile['beam']
+        decoder_opts.lattice_beam = self.profile['lattice_beam']
+        decoder_opts.max_active = self.profile['max_active']
+        decoder_opts.determinize_lattice = self.lattice
         decodable_opts = NnetSimpleComputationOptions()
-        decodable_opts.acoustic_scale = 1.0
+        decodable_opts.acoustic_scale = self.profile['acoustic_scale']
         decodable_opts.frame_subsampling_factor = 3
-        self.asr = NnetLatticeFasterRecognizer.from_files(self.model, self.graph, self.words,
-                decoder_opts=decoder_opts, decodable_opts=decodable_opts)
-    
-    def recognize(self, wav=None):
+        decodable_opts.frames_per_chunk = self.profile['frames_per_chunk']
+        self.asr = NnetLatticeFasterRecognizer(self.transition_model, self.acoustic_model, self.decoding_graph, 
+                self.symbols, decoder_opts=decoder_opts, decodable_opts=decodable_opts, 
+                online_ivector_period=ONLINE_IVECTOR_PERIOD)
+        if self.batch_size:
+            self.batch_opts = NnetBatchComputerOptions()
+            self.batch_opts.acoustic_scale = self.profile['acoustic_scale']
+            self.batch_opts.frame_subsampling_factor = 3
+            self.batch_opts.frames_per_chunk = self.profile['frames_per_chunk']
+            self.batch_opts.minibatch_size = self.batch_size
+            self.mapped_asr = MappedLatticeFasterRecognizer(self.transition_model, self.decoding_graph, self.symbols, 
+                    decoder_opts=decoder_opts, acoustic_scale=1.0)
+
+    def read_utterances(self, scp, spk2utt):
         """
-        Распознавание речи       
+        Чтение признаков и i-векторов сегментов
         
         Аргументы:
-            wav: наименование аудио файла
+            scp: путь к .SCP файлу с аудио
+            spk2utt: путь к файлу перечисления сегментов для каждого говорящего
 
         Результат:
-            transcriptions: путь к файлу транскрибации
+            utterances: генератор кортежей (идентификатор сегмента, признаки, i-векторы)
         """
-        transcriptions = str(self.output / wav) if wav else 'transcriptions'
-        feats_rspec = ("ark:compute-mfcc-feats --config=" + self.conf + " scp:" + self.scp + " ark:- |")
+        feats_rspec = ("ark:compute-mfcc-feats --config=" + self.conf + " scp:" + scp + " ark:- |")
         ivectors_rspec = (feats_rspec + "ivector-extract-online2 "
                         "--config=" + self.iconf + " "
-                        "ark:" + self.spk2utt + " ark:- ark:- |")
-        lat_wspec = "ark:| gzip -c > lat.gz"   
+                        "ark:" + spk2utt + " ark:- ark:- |")
         with SequentialMatrixReader(feats_rspec) as feats_reader, \
-            SequentialMatrixReader(ivectors_rspec) as ivectors_reader, \
-            CompactLatticeWriter(lat_wspec) as lat_writer:
+            SequentialMatrixReader(ivectors_rspec) as ivectors_reader:
             for (fkey, feats), (ikey, ivectors) in zip(feats_reader, ivectors_reader):
                 assert(fkey == ikey)
-                out = self.asr.decode((feats, ivectors))
-                lat_writer[fkey] = out['lattice']
-                if self.printed:
-                    print(fkey, out['text'], flush=True)
-                with open(transcriptions, 'a') as f:
-                    f.write(fkey + '\t' + out['text'].lower() + '\n')
+                yield fkey, feats, ivectors
+
+    def decode_batch(self, utterances):
+        """
+        Пакетное вычисление нейросети по чанкам всех сегментов и декодирование каждого сегмента
+        по мере готовности его апостериорных вероятностей
+        
+        Аргументы:
+            utterances: итератор кортежей (идентификатор сегмента, признаки, i-векторы)
+
+        Результат:
+            outputs: генератор кортежей (идентификатор сегмента, результат декодирования)
+        """
+        inference = NnetBatchInference(self.batch_opts, self.acoustic_model.get_nnet(), self.acoustic_model.priors())
+        for key, feats, ivectors in utterances:
+            inference.accept_input(key, Matrix(feats), None, Matrix(ivectors), ONLINE_IVECTOR_PERIOD)
+            yield from self.drain_batch(inference)
+        inference.finished()
+        yield from self.drain_batch(inference)
+
+    def drain_batch(self, inference):
+        """
+        Декодирование сегментов, вычисление нейросети для которых завершено
+        
+        Аргументы:
+            inference: объект пакетного вычисления нейросети (NnetBatchInference)
+
+        Результат:
+            outputs: генератор кортежей (идентификатор сегмента, результат декодирования)
+        """
+        while True:
+            success, key, loglikes = inference.get_output()
+            if not success:
+                break
+            yield key, self.mapped_asr.decode(loglikes)
+
+    def decode(self, utterances):
+        """
+        Декодирование сегментов в пакетном или последовательном режиме
+        
+        Аргументы:
+            utterances: итератор кортежей (идентификатор сегмента, признаки, i-векторы)
+
+        Результат:
+            outputs: генератор кортежей (идентификатор сегмента, результат декодирования)
+        """
+        if self.batch_size:
+            yield from self.decode_batch(utterances)
+        else:
+            for key, feats, ivectors in utterances:
+                yield key, self.asr.decode((feats, ivectors))
+    
+    def recognize(self, wav=None, lattice=None, scp=None, spk2utt=None, output=None):
+        """
+        Распознавание речи       
+        
+        Аргументы:
+            wav: наименование аудио файла
+            lattice: путь к .GZ файлу решеток (при включенной генерации решеток);
+                     по умолчанию решетки записываются в директорию с результатами
+            scp: путь к .SCP файлу с аудио (по умолчанию указанный при инициализации)
+            spk2utt: путь к файлу перечисления сегментов для каждого говорящего (по умолчанию указанный 
+                     при инициализации)
+            output: путь к директории с результатами распознавания (по умолчанию указанная при инициализации)
+
+        Результат:
+            transcriptions: путь к файлу транскрибации
+        """
+        output = Path(output or self.output)
+        transcriptions = str(output / wav) if wav else 'transcriptions'
+        lat_writer = None
+        if self.lattice:
+            lattice = lattice or str(output / ((wav or 'lat') + '.lat.gz'))
+            lat_writer = CompactLatticeWriter("ark:| gzip -c > " + lattice)
+        try:
+            for key, out in self.decode(self.read_utterances(scp or self.scp, spk2utt or self.spk2utt)):
+                self.write_output(key, out, transcriptions, lat_writer)
+        finally:
+            if lat_writer is not None:
+                lat_writer.close()
         return transcriptions
 
+    def write_output(self, key, out, transcriptions, lat_writer=None):
+        """
+        Запись результата декодирования сегмента
+        
+        Аргументы:
+            key: идентификатор сегмента
+            out: результат декодирования
+            transcriptions: путь к файлу транскрибации
+            lat_writer: объект записи решеток или None
+        """
+        if lat_writer is not None:
+            lat_writer[key] = out['lattice']
+        if self.printed:
+            print(key, out['text'], flush=True)
+        with open(transcriptions, 'a') as f:
+            f.write(key + '\t' + out['text'].lower() + '\n')
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Утилита для распознавания речи')
@@ -88,8 +232,12 @@ if __name__ == '__main__':
     parser.add_argument('-o', '--output', metavar='OUT', help='Путь к директории с результатами распознавания')
     parser.add_argument('-p', '--printed', dest='printed', action='store_true', help='Печатать результат распознавания')
     parser.add_argument('-l', '--log', dest='log', action='store_true', help='Логировать результат распознавания')
+    parser.add_argument('-dp', '--decoding_profile', default=None, choices=list(DECODING_PROFILES), help='Профиль декодирования')
+    parser.add_argument('-lt', '--lattice', dest='lattice', action='store_true', help='Сохранять решетки распознавания')
+    parser.add_argument('-b', '--batch_size', default=None, type=int, help='Размер минипакета для пакетного вычисления нейросети')
 
     args = parser.parse_args()
 
-    recognizer = Recognizer(args.scp, args.model, args.graph, args.words, args.conf, args.iconf, args.spk2utt, args.output, args.printed, args.log)
+    recognizer = Recognizer(args.scp, args.model, args.graph, args.words, args.conf, args.iconf, args.spk2utt, args.output, 
+                            args.printed, args.log, args.decoding_profile, lattice=args.lattice, batch_size=args.batch_size)
     recognizer.recognize()
\ No newline at end of file
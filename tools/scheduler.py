@@ -0,0 +1,359 @@
+#!/usr/bin/python
+import os
+import time
+import signal
+import logging
+import threading
+from collections import deque
+from multiprocessing import Process, Pipe
+from multiprocessing.connection import wait
+from tools.profiler import get_descendants
+from tools.utils import set_queue_handler, LOGGER_NAME
+
+START_STAGE = 'preparation'
+CONTROL_INTERVAL = 5.0
+REFILL_INTERVAL = 1.0
+_CONNECTION = None
+LOGGER = logging.getLogger(LOGGER_NAME)
+
+def report_stage(name):
+    """
+    Передача планировщику наименования начатого этапа (вне процесса планировщика не выполняет действий)
+
+    Аргументы:
+        name: наименование этапа
+    """
+    if _CONNECTION is not None:
+        _CONNECTION.send(('stage', name))
+
+def parse_timeouts(text):
+    """
+    Разбор ограничений длительности этапов
+
+    Аргументы:
+        text: строка вида '600' или 'segmentation=300,recognition=900,*=600'
+
+    Результат:
+        timeouts: словарь ограничений в секундах по наименованиям этапов ('*' - для остальных этапов)
+    """
+    timeouts = {}
+    for item in (text or '').split(','):
+        if not item.strip():
+            continue
+        stage, _, value = item.rpartition('=')
+        timeouts[stage.strip() or '*'] = float(value)
+    return timeouts
+
+def get_memory_available():
+    """
+    Получение объема доступной памяти
+
+    Результат:
+        available: объем доступной памяти в МБ
+    """
+    with open('/proc/meminfo', 'r') as f:
+        for line in f:
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1]) / 1024
+    return float('inf')
+
+def get_process_rss(pid):
+    """
+    Получение резидентной памяти процесса и его дочерних процессов
+
+    Аргументы:
+        pid: идентификатор процесса
+
+    Результат:
+        rss: объем резидентной памяти в МБ
+    """
+    rss = 0
+    for child in [pid] + get_descendants(pid):
+        try:
+            with open('/proc/{}/status'.format(child), 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return rss / 1024
+
+def kill_process_tree(pid):
+    """
+    Принудительное завершение процесса и его дочерних процессов
+
+    Аргументы:
+        pid: идентификатор процесса
+    """
+    for child in [pid] + get_descendants(pid):
+        try:
+            os.kill(child, signal.SIGKILL)
+        except OSError:
+            pass
+
+class ConnectionQueue(object):
+    """Класс очереди записей лога, передаваемых родительскому процессу через канал процесса обработки"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        with self.lock:
+            self.connection.send(message)
+
+    def put_nowait(self, record):
+        self.send(('log', record))
+
+def run_worker(target, connection, logger_name=None):
+    global _CONNECTION
+    _CONNECTION = ConnectionQueue(connection)
+    if logger_name:
+        set_queue_handler(logger_name, _CONNECTION)
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        report_stage(START_STAGE)
+        _CONNECTION.send(('done', target(task)))
+
+class Worker(object):
+    """Класс процесса обработки файлов"""
+
+    def __init__(self, target, logger_name=None):
+        """
+        Запуск процесса обработки
+
+        Аргументы:
+            target: функция обработки файла
+            logger_name: название логгера, записи которого передаются родительскому процессу, или None
+        """
+        self.connection, child = Pipe()
+        self.process = Process(target=run_worker, args=(target, child, logger_name), daemon=True)
+        self.process.start()
+        child.close()
+        self.task = None
+        self.stage = None
+        self.started = None
+        self.rss = 0.0
+
+    def assign(self, task):
+        """
+        Передача файла процессу обработки
+
+        Аргументы:
+            task: файл
+
+        Результат:
+            assigned: признак передачи (False, если процесс завершился, ожидая задания)
+        """
+        if not self.process.is_alive():
+            return False
+        try:
+            self.connection.send(task)
+        except OSError:
+            return False
+        self.task, self.stage, self.started = task, START_STAGE, time.monotonic()
+        return True
+
+    def retire(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            kill_process_tree(self.process.pid)
+        self.process.join()
+        self.connection.close()
+
+class MemoryController(object):
+    """Класс регулирования количества процессов обработки по доступной памяти"""
+
+    def __init__(self, max_workers, reserve, min_workers=1):
+        """
+        Инициализация регулятора
+
+        Аргументы:
+            max_workers: максимальное количество процессов
+            reserve: объем памяти в МБ, который должен оставаться доступным
+            min_workers: минимальное количество процессов
+        """
+        self.max_workers = max_workers
+        self.min_workers = min(min_workers, max_workers)
+        self.reserve = reserve
+        self.target = max_workers
+
+    def update(self, workers):
+        """
+        Пересчет целевого количества процессов: уменьшение при нехватке памяти и увеличение,
+        если доступной памяти хватает еще на один процесс с запасом
+
+        Аргументы:
+            workers: список процессов обработки
+
+        Результат:
+            target: целевое количество процессов
+        """
+        available = get_memory_available()
+        for worker in workers:
+            worker.rss = get_process_rss(worker.process.pid)
+        per_worker = max([worker.rss for worker in workers] or [0])
+        if available < self.reserve and self.target > self.min_workers:
+            self.target -= 1
+            LOGGER.warning("Недостаточно памяти ({:.0f} МБ), количество процессов уменьшено до {}".format(
+                available, self.target))
+        elif available - per_worker > 2 * self.reserve and self.target < self.max_workers:
+            self.target += 1
+            LOGGER.info("Количество процессов увеличено до {}".format(self.target))
+        return self.target
+
+class Scheduler(object):
+    """Класс планировщика обработки файлов с ограничением длительности этапов и регулированием числа процессов"""
+
+    def __init__(self, target, processes, timeouts=None, memory_reserve=None, on_timeout=None, logger_name=None, 
+                 log_queue=None):
+        """
+        Инициализация планировщика
+
+        Аргументы:
+            target: функция обработки файла, возвращающая статистику обработки
+            processes: максимальное количество процессов обработки
+            timeouts: словарь ограничений длительности этапов в секундах ('*' - для остальных этапов)
+            memory_reserve: объем памяти в МБ, который должен оставаться доступным, или None
+                            для постоянного количества процессов
+            on_timeout: функция (файл, этап, причина), вызываемая после принудительного завершения
+                        процесса и возвращающая статистику обработки файла
+            logger_name: название логгера процессов обработки, записи которого передаются в log_queue
+            log_queue: очередь записей лога родительского процесса (например, обрабатываемая QueueListener)
+        """
+        self.target = target
+        self.processes = processes
+        self.timeouts = timeouts or {}
+        self.controller = MemoryController(processes, memory_reserve) if memory_reserve else None
+        self.on_timeout = on_timeout
+        self.logger_name = logger_name if log_queue is not None else None
+        self.log_queue = log_queue
+        self.workers = []
+        self.pending = deque()
+        self.refill = None
+        self.refilled = 0.0
+        self.controlled = 0.0
+        self.restarts = 0
+
+    @property
+    def busy(self):
+        return sum(1 for worker in self.workers if worker.task is not None)
+
+    def get_timeout(self, stage):
+        return self.timeouts.get(stage, self.timeouts.get('*'))
+
+    def abort(self, worker, reason):
+        """
+        Принудительное завершение процесса и формирование статистики прерванного файла
+
+        Аргументы:
+            worker: процесс обработки
+            reason: причина завершения (timeout, died)
+
+        Результат:
+            stats: статистика обработки файла
+        """
+        task, stage = worker.task, worker.stage
+        worker.kill()
+        self.workers.remove(worker)
+        self.restarts += 1
+        LOGGER.error("Процесс обработки файла '{}' завершен на этапе '{}' ({})".format(task, stage, reason))
+        return self.on_timeout(task, stage, reason) if self.on_timeout else None
+
+    def balance(self):
+        """
+        Запуск и остановка процессов до целевого количества, пополнение ожидающих файлов
+        по числу свободных процессов и их распределение
+        """
+        if self.controller and time.monotonic() - self.controlled >= CONTROL_INTERVAL:
+            self.controlled = time.monotonic()
+            self.controller.update(self.workers)
+        target = self.controller.target if self.controller else self.processes
+        free = target - self.busy - len(self.pending)
+        if self.refill and free > 0 and time.monotonic() - self.refilled >= REFILL_INTERVAL:
+            tasks = self.refill(free)
+            self.pending.extend(tasks)
+            if not tasks:
+                self.refilled = time.monotonic()
+        for worker in [worker for worker in self.workers if worker.task is None][:max(len(self.workers) - target, 0)]:
+            worker.retire()
+            self.workers.remove(worker)
+        while self.pending:
+            idle = [worker for worker in self.workers if worker.task is None]
+            if idle:
+                task = self.pending.popleft()
+                if not idle[0].assign(task):
+                    self.pending.appendleft(task)
+                    idle[0].kill()
+                    self.workers.remove(idle[0])
+                    self.restarts += 1
+                    LOGGER.warning("Процесс обработки завершился в ожидании задания и будет перезапущен")
+            elif len(self.workers) < target:
+                self.workers.append(Worker(self.target, self.logger_name))
+            else:
+                break
+
+    def run(self, tasks, refill=None):
+        """
+        Обработка файлов
+
+        Аргументы:
+            tasks: список файлов
+            refill: функция (количество), вызываемая при появлении свободных процессов и возвращающая
+                    список не более указанного количества новых файлов, или None
+
+        Результат:
+            results: генератор статистик обработки файлов в порядке завершения
+        """
+        self.pending.extend(tasks)
+        self.refill, self.refilled = refill, 0.0
+        while self.pending or self.busy:
+            self.balance()
+            busy = [worker for worker in self.workers if worker.task is not None]
+            for connection in wait([worker.connection for worker in busy], timeout=1.0):
+                worker = next(worker for worker in busy if worker.connection is connection)
+                try:
+                    kind, value = connection.recv()
+                except (EOFError, OSError):
+                    stats = self.abort(worker, 'died')
+                    if stats is not None:
+                        yield stats
+                    continue
+                if kind == 'log':
+                    self.log_queue.put_nowait(value)
+                elif kind == 'stage':
+                    worker.stage, worker.started = value, time.monotonic()
+                else:
+                    worker.task = None
+                    yield value
+            now = time.monotonic()
+            for worker in [worker for worker in self.workers if worker.task is not None]:
+                timeout = self.get_timeout(worker.stage)
+                reason = 'died' if not worker.process.is_alive() else \
+                         'timeout' if timeout and now - worker.started > timeout else None
+                if reason:
+                    stats = self.abort(worker, reason)
+                    if stats is not None:
+                        yield stats
+
+    def close(self):
+        """Завершение всех процессов обработки"""
+        for worker in self.workers:
+            if worker.task is None:
+                worker.retire()
+            else:
+                worker.kill()
+        self.workers = []
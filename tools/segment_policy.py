@@ -0,0 +1,94 @@
+#!/usr/bin/python
+import numpy as np
+
+class SegmentPolicy(object):
+    """Класс для объединения коротких и разбиения длинных сегментов перед распознаванием"""
+
+    def __init__(self, min_length=1.0, max_length=15.0, max_gap=0.3, frame_shift=0.01):
+        """
+        Инициализация политики сегментов
+
+        Аргументы:
+            min_length: минимальная длительность сегмента в секундах
+            max_length: максимальная длительность сегмента в секундах
+            max_gap: максимальная пауза между объединяемыми сегментами в секундах
+            frame_shift: сдвиг кадра в секундах
+        """
+        self.min_frames = int(round(min_length / frame_shift))
+        self.max_frames = int(round(max_length / frame_shift))
+        self.max_gap = int(round(max_gap / frame_shift))
+        if self.max_frames <= 1:
+            raise ValueError("Максимальная длительность сегмента должна превышать один кадр: {}".format(max_length))
+        if self.min_frames >= self.max_frames:
+            raise ValueError("Минимальная длительность сегмента ({}) должна быть меньше максимальной ({})".format(
+                min_length, max_length))
+
+    @staticmethod
+    def make_segment(segment, start, end):
+        return type(segment)([start, end] + list(segment[2:]))
+
+    def merge(self, segments):
+        """
+        Объединение соседних коротких сегментов, разделенных короткой паузой
+
+        Аргументы:
+            segments: список сегментов (начальный кадр, конечный кадр, ...)
+
+        Результат:
+            segments: список объединенных сегментов
+        """
+        merged = []
+        for segment in sorted(segments, key=lambda s: s[0]):
+            if merged:
+                last = merged[-1]
+                short = last[1] - last[0] < self.min_frames or segment[1] - segment[0] < self.min_frames
+                if (short and list(last[2:]) == list(segment[2:]) and segment[0] - last[1] <= self.max_gap
+                        and segment[1] - last[0] <= self.max_frames):
+                    merged[-1] = self.make_segment(last, last[0], max(last[1], segment[1]))
+                    continue
+            merged.append(segment)
+        return merged
+
+    def split(self, segments, energy=None):
+        """
+        Разбиение длинных сегментов в точках минимальной энергии на минимально возможное число частей;
+        точка разбиения выбирается так, чтобы остаток можно было разбить на части не короче
+        минимальной и не длиннее максимальной длительности
+
+        Аргументы:
+            segments: список сегментов (начальный кадр, конечный кадр, ...)
+            energy: энергия кадров (например, нулевой кепстральный коэффициент) или None
+
+        Результат:
+            segments: список сегментов не длиннее максимальной длительности
+        """
+        result = []
+        for segment in segments:
+            start, end = segment[0], segment[1]
+            while end - start > self.max_frames:
+                parts = int(np.ceil((end - start) / self.max_frames))
+                low = start + max(self.min_frames, end - start - (parts - 1) * self.max_frames)
+                high = start + min(self.max_frames, end - start - (parts - 1) * self.min_frames)
+                if low > high:
+                    low = high = start + (end - start) // parts
+                if energy is not None and high < len(energy):
+                    cut = low + int(np.argmin(energy[low:high + 1]))
+                else:
+                    cut = start + (end - start) // parts
+                result.append(self.make_segment(segment, start, cut))
+                start = cut
+            result.append(self.make_segment(segment, start, end))
+        return result
+
+    def apply(self, segments, energy=None):
+        """
+        Применение политики к сегментам одного канала
+
+        Аргументы:
+            segments: список сегментов (начальный кадр, конечный кадр, ...)
+            energy: энергия кадров или None
+
+        Результат:
+            segments: список сегментов
+        """
+        return self.split(self.merge(segments), energy)
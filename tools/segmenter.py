@@ -3,15 +3,25 @@ import argparse
 import subprocess
 from pathlib import Path
 import logging
-from tools.utils import make_spk2utt
+import numpy as np
+from tools.utils import make_spk2utt, LOGGER_NAME
 from kaldi.segmentation import NnetSAD, SegmentationProcessor
 from kaldi.nnet3 import NnetSimpleComputationOptions
 from kaldi.util.table import SequentialMatrixReader
+from tools.decoding import get_profile, DECODING_PROFILES
+from tools.segment_policy import SegmentPolicy
+
+FRAME_SHIFT = 0.01
+SPEECH_LABEL = 2
+CONTEXT_MARGIN = 100
+FLUSH_SILENCE = 100
+MAX_PENDING_WINDOWS = 3
+LOGGER = logging.getLogger(LOGGER_NAME)
 
 class Segmenter(object):
     """Класс для сегментации аудио с помощью алгоритма обнаружения активности голоса (VAD)"""
 
-    def __init__(self, scp, model, post, conf, output, log=False):
+    def __init__(self, scp, model, post, conf, output, log=False, profile=None, options=None, policy=None, bundle=None):
         """
         Инициализация сегментатора
         
@@ -22,59 +32,190 @@ class Segmenter(object):
             conf: путь к .CONF конфигурационному файлу сегментации
             output: путь к директории с результатами сегментации
             log: признак логирования
+            profile: название профиля декодирования (fast, balanced, accurate)
+            options: словарь параметров, переопределяющих значения профиля
+            policy: политика объединения и разбиения сегментов (SegmentPolicy) или None
+            bundle: пакет моделей (Bundle), заменяющий model, post и conf, или None
         """  
         self.scp = scp
         self.model = model
         self.post = post
         self.conf = conf
-        self.output = Path(output)
+        self.output = Path(output) if output else None
         self.log = log
+        self.profile = get_profile(profile, options)
+        self.policy = policy
 
-        sad_model = NnetSAD.read_model(model)
-        sad_post = NnetSAD.read_average_posteriors(post)
-        sad_transform = NnetSAD.make_sad_transform(sad_post)
-        sad_graph = NnetSAD.make_sad_graph()
+        if bundle is not None:
+            self.conf = bundle.segm_conf
+            sad_model, sad_transform, sad_graph = bundle.load_segmenter()
+        else:
+            sad_model = NnetSAD.read_model(model)
+            sad_post = NnetSAD.read_average_posteriors(post)
+            sad_transform = NnetSAD.make_sad_transform(sad_post)
+            sad_graph = NnetSAD.make_sad_graph()
         decodable_opts = NnetSimpleComputationOptions()
-        decodable_opts.extra_left_context = 79
-        decodable_opts.extra_right_context = 21
+        decodable_opts.extra_left_context = self.profile['sad_extra_left_context']
+        decodable_opts.extra_right_context = self.profile['sad_extra_right_context']
         decodable_opts.extra_left_context_initial = 0
         decodable_opts.extra_right_context_final = 0
-        decodable_opts.frames_per_chunk = 150
-        decodable_opts.acoustic_scale = 0.3
+        decodable_opts.frames_per_chunk = self.profile['sad_frames_per_chunk']
+        decodable_opts.acoustic_scale = self.profile['sad_acoustic_scale']
         self.sad = NnetSAD(sad_model, sad_transform, sad_graph, decodable_opts=decodable_opts)
-        self.seg = SegmentationProcessor([2])
+        self.seg = SegmentationProcessor([SPEECH_LABEL])
     
-    def segment(self):
+    def make_regions_scp(self, regions, window=None, scp=None, output=None):
+        """
+        Формирование .SCP файла с интервалами каналов, передаваемыми в сегментацию
+        
+        Аргументы:
+            regions: словарь интервалов (начало, конец) в секундах по идентификаторам каналов;
+                     каналы, отсутствующие в словаре, передаются целиком
+            window: длительность окна потоковой сегментации в секундах или None
+            scp: путь к .SCP файлу с аудио (по умолчанию указанный при инициализации)
+            output: путь к директории с результатами сегментации (по умолчанию указанный при инициализации)
+
+        Результат:
+            regions_scp: путь к .SCP файлу с интервалами аудио
+            entries: словарь описаний окон по идентификаторам записей .SCP файла
+        """
+        regions_scp = str(Path(output or self.output) / 'wav_regions.scp')
+        window = int(round(window / FRAME_SHIFT)) if window else None
+        left = self.profile['sad_extra_left_context'] + CONTEXT_MARGIN
+        right = self.profile['sad_extra_right_context'] + CONTEXT_MARGIN
+        entries = {}
+        with open(scp or self.scp, 'r') as wav_scp, open(regions_scp, 'w') as f:
+            for line in wav_scp:
+                key, wav = line.rstrip('\n').split(None, 1)
+                if key not in regions:
+                    entries[key] = {'channel': key, 'offset': 0, 'core_start': 0, 'core_end': None, 
+                                    'first': True, 'last': True}
+                    f.write(key + '\t' + wav + '\n')
+                    continue
+                command = wav.rstrip()[:-1].rstrip() if wav.rstrip().endswith('|') else 'sox ' + wav + ' -t wav -'
+                # trim должен быть первым эффектом, иначе sox декодирует аудио с начала файла вместо перемотки
+                head, sep, effects = command.partition(' -t wav -')
+                for i, (start, end) in enumerate(regions[key]):
+                    start, end = int(round(start / FRAME_SHIFT)), int(round(end / FRAME_SHIFT))
+                    cores = list(range(start, end, window)) if window else [start]
+                    for j, core in enumerate(cores):
+                        first, last = j == 0, j == len(cores) - 1
+                        window_start = start if first else max(start, core - left)
+                        window_end = end if last else min(end, core + window + right)
+                        entry_key = '{}_{}_{}'.format(key, i, j)
+                        entries[entry_key] = {'channel': key, 'offset': window_start, 'core_start': core - window_start, 
+                                              'core_end': None if last else core - window_start + window, 
+                                              'first': first, 'last': last}
+                        f.write(entry_key + '\t' + head + sep + ' trim {:.2f} ={:.2f}'.format(
+                            window_start * FRAME_SHIFT, window_end * FRAME_SHIFT) + effects + ' |\n')
+        return regions_scp, entries
+
+    def find_cut(self, alignment, limit):
+        """
+        Поиск точки, до которой выравнивание окон можно сегментировать независимо от последующих окон
+        
+        Аргументы:
+            alignment: накопленное выравнивание кадров
+            limit: максимальная длина накопленного выравнивания в кадрах
+
+        Результат:
+            cut: количество кадров, готовых к сегментации (0, если таких нет)
+        """
+        silence = np.concatenate([[0], (np.asarray(alignment) != SPEECH_LABEL).astype(np.int8), [0]])
+        edges = np.flatnonzero(np.diff(silence))
+        runs = [(start, end) for start, end in zip(edges[::2], edges[1::2]) if end - start >= FLUSH_SILENCE]
+        if runs:
+            return int((runs[-1][0] + runs[-1][1]) // 2)
+        return len(alignment) if len(alignment) >= limit else 0
+
+    def write_segments(self, key, alignment, energy, offset, file, policy=None):
+        """
+        Сегментация выравнивания и запись сегментов
+        
+        Аргументы:
+            key: идентификатор канала
+            alignment: выравнивание кадров
+            energy: энергия кадров для политики сегментов
+            offset: смещение первого кадра выравнивания относительно начала канала
+            file: файл описания сегментов
+            policy: политика объединения и разбиения сегментов или None
+        """
+        segs, _ = self.seg.process(alignment)
+        if policy:
+            segs = policy.apply(segs, energy)
+        if offset:
+            segs = [type(seg)([seg[0] + offset, seg[1] + offset] + list(seg[2:])) for seg in segs]
+        self.seg.write(key, segs, file)
+
+    def segment(self, regions=None, window=None, scp=None, output=None, policy=None):
         """
         Выполнение сегментации
         
+        Аргументы:
+            regions: словарь интервалов (начало, конец) в секундах по идентификаторам каналов,
+                     за пределами которых аудио не передается в сегментацию
+            window: длительность окна потоковой сегментации в секундах; признаки и выравнивание 
+                    рассчитываются по перекрывающимся окнам, а сегменты записываются по мере 
+                    появления пауз, поэтому потребление памяти не зависит от длительности аудио
+                    (требует указания regions)
+            scp: путь к .SCP файлу с аудио (по умолчанию указанный при инициализации)
+            output: путь к директории с результатами сегментации (по умолчанию указанная при инициализации)
+            policy: политика объединения и разбиения сегментов (по умолчанию указанная при инициализации)
+
         Результат:
             segments: путь к файлу описания сегментов
         """
-        feats_rspec = "ark:compute-mfcc-feats --verbose=0 --config=" + self.conf + " scp:" + self.scp + " ark:- |"
-        segments = str(self.output / 'segments')
+        if window and regions is None:
+            raise ValueError("Для потоковой сегментации необходимо указать интервалы каналов")
+        scp, output, policy = scp or self.scp, Path(output or self.output), policy or self.policy
+        scp, entries = self.make_regions_scp(regions, window, scp, output) if regions is not None else (scp, None)
+        limit = MAX_PENDING_WINDOWS * int(round(window / FRAME_SHIFT)) if window else float('inf')
+        feats_rspec = "ark:compute-mfcc-feats --verbose=0 --config=" + self.conf + " scp:" + scp + " ark:- |"
+        segments = str(output / 'segments')
         with SequentialMatrixReader(feats_rspec) as f, open(segments, 'w') as s:
+            channel, base, pending, energy = None, 0, [], np.zeros(0)
             for key, feats in f:
                 out = self.sad.segment(feats)
-                segs, _ = self.seg.process(out['alignment'])
-                self.seg.write(key, segs, s)
-                logging.info("Сегментирован файл '" + key + "'")
+                if entries is None:
+                    self.write_segments(key, out['alignment'], feats.numpy()[:, 0], 0, s, policy)
+                    LOGGER.info("Сегментирован файл '" + key + "'")
+                    continue
+                entry = entries[key]
+                if entry['first']:
+                    if pending:
+                        self.write_segments(channel, pending, energy, base, s, policy)
+                    channel, base = entry['channel'], entry['offset'] + entry['core_start']
+                    pending, energy = [], np.zeros(0)
+                core = slice(entry['core_start'], entry['core_end'])
+                pending.extend(list(out['alignment'])[core])
+                energy = np.concatenate([energy, feats.numpy()[core, 0]])
+                cut = len(pending) if entry['last'] else self.find_cut(pending, limit)
+                if cut:
+                    self.write_segments(channel, pending[:cut], energy[:cut], base, s, policy)
+                    pending, energy, base = pending[cut:], energy[cut:], base + cut
+                if entry['last']:
+                    LOGGER.info("Сегментирован файл '" + channel + "'")
+            if pending:
+                self.write_segments(channel, pending, energy, base, s, policy)
         return segments
 
-    def extract_segments(self, segments):
+    def extract_segments(self, segments, scp=None, output=None):
         """
         Извлечение сегментов
         
         Аргументы:
             segments: путь к файлу описания сегментов
+            scp: путь к .SCP файлу с аудио (по умолчанию указанный при инициализации)
+            output: путь к директории с результатами сегментации (по умолчанию указанная при инициализации)
 
         Результат:
             wav_segments: путь к .SCP файлу с аудио сегментов
             utt2spk: путь к файлу сопоставления сегментов и говорящих
             spk2utt: путь к файлу перечисления сегментов для каждого говорящего
         """
-        wav_segments = str(self.output / 'wav_segments.scp')
-        utt2spk = str(self.output / 'utt2spk')
+        scp, output = scp or self.scp, Path(output or self.output)
+        wav_segments = str(output / 'wav_segments.scp')
+        utt2spk = str(output / 'utt2spk')
         with open(segments, 'r') as s, \
             open(wav_segments, 'w') as ws, \
             open(utt2spk, 'w') as u:
@@ -82,10 +223,10 @@ class Segmenter(object):
                 segment_info = segment.split(' ')
                 segment_id = segment_info[0]
                 speaker_id = segment.split(' ')[1].split('.')[-1] or segment_id
-                ws.write(segment_id + '\t' + str(self.output / '@')[:-1] + segment_id + '.wav' + '\n')
+                ws.write(segment_id + '\t' + str(output / '@')[:-1] + segment_id + '.wav' + '\n')
                 u.write(segment_id + '\tКанал ' + speaker_id + '\n')
         spk2utt = make_spk2utt(utt2spk)
-        extract_command = "extract-segments scp:" + self.scp + " " + str(self.output / 'segments') + " scp:" + str(self.output / 'wav_segments.scp')
+        extract_command = "extract-segments scp:" + scp + " " + str(output / 'segments') + " scp:" + str(output / 'wav_segments.scp')
         with subprocess.Popen(extract_command, shell=True):
             pass
         return wav_segments, utt2spk, spk2utt
@@ -99,11 +240,19 @@ if __name__ == '__main__':
     parser.add_argument('-c', '--conf', metavar='CONF', help='Путь к .CONF конфигурационному файлу сегментации')
     parser.add_argument('-o', '--output', metavar='OUT', help='Путь к директории с результатами сегментации')
     parser.add_argument('-l', '--log', dest='log', action='store_true', help='Логировать результат сегментации')
+    parser.add_argument('-dp', '--decoding_profile', default=None, choices=list(DECODING_PROFILES), help='Профиль декодирования')
+    parser.add_argument('-ms', '--merge_segments', dest='merge_segments', action='store_true', 
+                        help='Объединять короткие и разбивать длинные сегменты')
+    parser.add_argument('-mn', '--segment_min', default=1.0, type=float, help='Минимальная длительность сегмента в секундах')
+    parser.add_argument('-mx', '--segment_max', default=15.0, type=float, help='Максимальная длительность сегмента в секундах')
+    parser.add_argument('-mg', '--segment_gap', default=0.3, type=float, help='Максимальная пауза между объединяемыми сегментами в секундах')
 
     args = parser.parse_args()
 
     try:
-        segmenter = Segmenter(args.scp, args.model, args.post, args.conf, args.output, args.log)
+        policy = SegmentPolicy(args.segment_min, args.segment_max, args.segment_gap) if args.merge_segments else None
+        segmenter = Segmenter(args.scp, args.model, args.post, args.conf, args.output, args.log, args.decoding_profile, 
+                              policy=policy)
         segments = segmenter.segment()
     except:
         logging.error("Не удалось выполнить сегментацию аудио")
@@ -1,5 +1,4 @@
 #!/usr/bin/python
-import os
 import glob
 import argparse
 import csv
@@ -11,8 +10,8 @@ import numpy as np
 import pandas as pd
 import pysubs2
 from pathlib import Path
-from multiprocessing import Pool, cpu_count
-from tools.utils import create_logger
+from multiprocessing import Pool, Queue, cpu_count
+from tools.utils import create_logger, set_queue_handler, start_log_listener, LOGGER_NAME
 
 class TranscriptionsParser(object):
     """Класс для парсинга файлов транскрибации"""
@@ -120,9 +119,9 @@ class TranscriptionsParser(object):
         """
         transcriptions = pd.DataFrame(columns=['Audio File', 'Start', 'End', 'Name', 'Text'])
         if self.log:
-            logger = create_logger('logger_' + str(os.getpid()), 'file', logging.DEBUG, self.log)
+            logger = create_logger(LOGGER_NAME, 'file', logging.DEBUG, self.log)
         else:
-            logger = create_logger('logger','stream', logging.DEBUG)        
+            logger = create_logger(LOGGER_NAME, 'stream', logging.DEBUG)
         for file in batch:
             try:
                 transcription = pysubs2.load(file)
@@ -195,16 +194,19 @@ if __name__ == '__main__':
     except:
         raise Exception("Не удалось создать результирующий .CSV-файл")
         
+    log_name = ''
     if LOG_DIR:
         try:
             log_name = str(LOG_DIR / str(time.strftime('%Y%m%d-%H%M%S') + '.log'))
-            logger = create_logger('logger', 'file', logging.DEBUG, log_name)
+            logger = create_logger(LOGGER_NAME, 'file', logging.DEBUG, log_name)
         except:
             raise Exception("Не удалось создать лог-файл")
     else:
-        logger = create_logger('logger', 'stream', logging.INFO)
+        logger = create_logger(LOGGER_NAME, 'stream', logging.INFO)
     
-    pool = Pool(PROCESSES)
+    log_queue = Queue()
+    listener = start_log_listener(logger, log_queue)
+    pool = Pool(PROCESSES, set_queue_handler, (LOGGER_NAME, log_queue))
     logger.info("Запуск парсинга файлов")
     logger.debug("Количество процессов: {}".format(PROCESSES))
     logger.debug("Размер пакета: {}".format(BATCH_SIZE))
@@ -217,6 +219,7 @@ if __name__ == '__main__':
         pass
     pool.close()
     pool.join()
+    listener.stop()
     
     if IS_PICKLE:
         try:
@@ -2,6 +2,7 @@ import os
 import glob
 import shutil
 import logging
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 import pandas as pd
 import wave
@@ -9,6 +10,10 @@ import pysubs2
 import librosa
 import soundfile
 
+LOGGER_NAME = 'logger'
+LOG_FIELDS = ('wav', 'stage')
+LOG_CONTEXT = {}
+
 def clear_folder(folder):
     """
     Удаление всех файлов из директории
@@ -64,6 +69,19 @@ def prepare_wav(wav):
             os.remove(old_wav)
     return wav
 
+def get_wav_duration(wav):
+    """
+    Получение длительности аудио
+
+    Аргументы:
+        wav: путь к .WAV файлу аудио
+
+    Результат:
+        duration: длительность аудио в секундах
+    """
+    with wave.open(wav, 'r') as wav_file:
+        return wav_file.getnframes() / wav_file.getframerate()
+
 def make_wav_scp(wav, scp):
     """
     Формирование .SCP файла для аудио
@@ -80,6 +98,21 @@ def make_wav_scp(wav, scp):
             f.write(str(Path(wav).stem) + '.0\t' + 'sox ' + wav + ' -t wav - remix 1 |\n')
             f.write(str(Path(wav).stem) + '.1\t' + 'sox ' + wav + ' -t wav - remix 2 |\n')          
 
+def get_channel_regions(wav):
+    """
+    Формирование интервалов, охватывающих каналы аудио целиком
+
+    Аргументы:
+        wav: путь к .WAV файлу аудио
+
+    Результат:
+        regions: словарь интервалов (начало, конец) в секундах по идентификаторам каналов
+    """
+    with wave.open(wav, 'r') as wav_file:
+        duration = wav_file.getnframes() / wav_file.getframerate()
+        channels = 1 if wav_file.getnchannels() == 1 else 2
+    return {str(Path(wav).stem) + '.' + str(channel): [(0.0, duration)] for channel in range(channels)}
+
 def make_spk2utt(utt2spk):
     """
     Формирование spk2utt файла
@@ -124,9 +157,32 @@ def make_ass(wav, segments, transcriptions, utt2spk, ass):
     sub.sort()
     sub.save(ass, format_='ass')
 
+class LogContextFilter(logging.Filter):
+    """Фильтр, добавляющий в записи лога наименование файла и этап пайплайна текущего процесса"""
+
+    def filter(self, record):
+        for field in LOG_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, LOG_CONTEXT.get(field) or '-')
+        return True
+
+def set_log_context(**fields):
+    """
+    Установка полей записей лога текущего процесса
+
+    Аргументы:
+        fields: значения полей (wav - наименование аудио файла, stage - этап пайплайна)
+    """
+    LOG_CONTEXT.update(fields)
+
+def add_context_filter(logger):
+    if not any(isinstance(f, LogContextFilter) for f in logger.filters):
+        logger.addFilter(LogContextFilter())
+
 def create_logger(logger_name, logger_type, logger_level, filename=None):
     """
-    Создание логгера
+    Создание логгера; повторный вызов с теми же параметрами возвращает настроенный логгер, 
+    с другими - заменяет обработчик, а логгер процесса обработки, направленный в очередь, не изменяет
     
     Аргументы:
         logger_name: название логгера
@@ -138,9 +194,21 @@ def create_logger(logger_name, logger_type, logger_level, filename=None):
         logger: объект логгера        
     """    
     logger = logging.getLogger(logger_name)
+    add_context_filter(logger)
+    for handler in logger.handlers:
+        if isinstance(handler, QueueHandler):
+            return logger
+        if logger_type == 'file' and isinstance(handler, logging.FileHandler) and \
+                handler.baseFilename == os.path.abspath(filename):
+            return logger
+        if logger_type == 'stream' and type(handler) is logging.StreamHandler:
+            return logger
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
     if logger_type == 'file':
         file_handler = logging.FileHandler(filename=filename)
-        formatter = logging.Formatter(fmt='%(asctime)s \t %(levelname)s \t %(message)s',
+        formatter = logging.Formatter(fmt='%(asctime)s \t %(levelname)s \t %(wav)s \t %(stage)s \t %(message)s',
                                             datefmt='%Y-%m-%d %H:%M:%S')
         file_handler.setFormatter(formatter)
         logger.addHandler(file_handler)
@@ -148,8 +216,39 @@ def create_logger(logger_name, logger_type, logger_level, filename=None):
         logger.propagate = False
     elif logger_type == 'stream':
         stream_handler = logging.StreamHandler()
-        formatter = logging.Formatter(fmt='%(levelname)s: %(message)s (%(asctime)s)')
+        formatter = logging.Formatter(fmt='%(levelname)s: [%(wav)s %(stage)s] %(message)s (%(asctime)s)')
         stream_handler.setFormatter(formatter)
         logger.addHandler(stream_handler)
-        logger.setLevel(logger_level)       
+        logger.setLevel(logger_level)
+        logger.propagate = False
     return logger
+
+def set_queue_handler(logger_name, queue):
+    """
+    Направление записей логгера процесса обработки в очередь, обрабатываемую родительским процессом
+
+    Аргументы:
+        logger_name: название логгера
+        queue: очередь записей лога (объект с методом put_nowait)
+    """
+    logger = logging.getLogger(logger_name)
+    add_context_filter(logger)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(QueueHandler(queue))
+    logger.propagate = False
+
+def start_log_listener(logger, queue):
+    """
+    Запуск записи лога процессов обработки обработчиками логгера родительского процесса
+
+    Аргументы:
+        logger: логгер родительского процесса
+        queue: очередь записей лога
+
+    Результат:
+        listener: запущенный объект QueueListener
+    """
+    listener = QueueListener(queue, *logger.handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -9,10 +9,14 @@ import librosa
 from librosa import display
 from time import time, gmtime, strftime
 from pathlib import Path
-from flask import Flask, render_template, request, redirect, flash
+from flask import Flask, Response, render_template, request, redirect, flash
 
 sys.path.append('..')
-from tools import data_preparator, segmenter, recognizer, transcriptions_parser
+from tools import transcriptions_parser
+from tools.models import ModelCache
+from tools.bundle import Bundle
+from tools.metrics import Registry, PipelineStats, CONTENT_TYPE
+from tools.decoding import DECODING_PROFILES, DEFAULT_PROFILE
 from tools.utils import make_ass, make_wav_scp, delete_folder
 
 app = Flask(__name__)
@@ -20,23 +24,39 @@ app.config['SECRET_KEY'] = '8dgn89vdf8vff8v9df99f'
 app.config['ALLOWED_EXTENSIONS'] = ['wav']
 app.config['MAX_CONTENT_LENGTH'] = 20 * 1024 * 1024
 app.config['UPLOAD_FOLDER'] = Path('data')
+MODELS = ModelCache()
+REGISTRY = Registry()
+BUNDLE = Bundle(os.environ['STT_BUNDLE']) if os.environ.get('STT_BUNDLE') else None
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
-def recognize(temp, wav):
-    wav_scp = str(Path(temp) / 'wav.scp')
-    make_wav_scp(wav, wav_scp)
-    segm = segmenter.Segmenter(wav_scp, '../model/final.raw', '../model/conf/post_output.vec', '../model/conf/mfcc_hires.conf', temp)
-    segments = segm.segment()
-    wav_segments_scp, utt2spk, spk2utt = segm.extract_segments(segments)
-    rec = recognizer.Recognizer(wav_segments_scp, '../model/final.mdl', '../model/HCLG.fst', '../model/words.txt', 
-                                '../model/conf/mfcc.conf', '../model/conf/ivector_extractor.conf', spk2utt, temp)
-    transcriptions = rec.recognize(Path(wav).stem)
-    ass = str(Path(temp) / 'wav.ass')
-    make_ass(Path(wav).name, segments, transcriptions, utt2spk, ass)
-    pars = transcriptions_parser.TranscriptionsParser('', '', '', 0, 0, 'wav.csv')
-    transcriptions_df = pars.process_file(ass)
+def recognize(temp, wav, duration, profile=None):
+    stats = PipelineStats(Path(wav).name, duration)
+    REGISTRY.active_workers.inc()
+    try:
+        wav_scp = str(Path(temp) / 'wav.scp')
+        make_wav_scp(wav, wav_scp)
+        with stats.stage('segmentation'):
+            with MODELS.use_segmenter('../model/final.raw', '../model/conf/post_output.vec', 
+                                      '../model/conf/mfcc_hires.conf', profile, stats, BUNDLE) as segm:
+                segments = segm.segment(scp=wav_scp, output=temp)
+        with stats.stage('extraction'):
+            wav_segments_scp, utt2spk, spk2utt = segm.extract_segments(segments, wav_scp, temp)
+        with stats.stage('recognition'):
+            with MODELS.use_recognizer('../model/final.mdl', '../model/HCLG.fst', '../model/words.txt', 
+                                       '../model/conf/mfcc.conf', '../model/conf/ivector_extractor.conf', profile, 
+                                       stats=stats, bundle=BUNDLE) as rec:
+                transcriptions = rec.recognize(Path(wav).stem, scp=wav_segments_scp, spk2utt=spk2utt, output=temp)
+        with stats.stage('subtitles'):
+            ass = str(Path(temp) / 'wav.ass')
+            make_ass(Path(wav).name, segments, transcriptions, utt2spk, ass)
+        with stats.stage('parsing'):
+            pars = transcriptions_parser.TranscriptionsParser('', '', '', 0, 0, 'wav.csv')
+            transcriptions_df = pars.process_file(ass)
+    finally:
+        REGISTRY.active_workers.dec()
+        REGISTRY.record(stats)
     return transcriptions_df
 
 def plot_waveform(temp, wav, channels):
@@ -57,7 +77,7 @@ def plot_waveform(temp, wav, channels):
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', profiles=list(DECODING_PROFILES), default_profile=DEFAULT_PROFILE)
 
 @app.route('/results', methods=['POST'])
 def upload_file():
@@ -83,7 +103,11 @@ def upload_file():
         start_time = time()
         temp = str(app.config['UPLOAD_FOLDER'] / Path(wav).stem)
         os.makedirs(temp, exist_ok=True)
-        transcriptions = recognize(temp, wav)
+        profile = request.form.get('decodingProfile', DEFAULT_PROFILE)
+        if profile not in DECODING_PROFILES:
+            profile = DEFAULT_PROFILE
+        info['Профиль декодирования'] = profile
+        transcriptions = recognize(temp, wav, wav_info['duration'], profile)
         waveform = plot_waveform(temp, wav, wav_info['channels']) if request.form.get('plotWaveform') else None
         delete_folder(temp)
         os.remove(wav)
@@ -94,7 +118,11 @@ def upload_file():
             transcriptions_html = transcriptions.to_html(index=False, justify='center', escape=False)        
         return render_template('results.html', filename='.'.join(filename.split('.')[:-1]), 
                                 info=info, waveform=waveform, transcriptions=transcriptions_html)
-    return render_template('index.html')
+    return render_template('index.html', profiles=list(DECODING_PROFILES), default_profile=DEFAULT_PROFILE)
+
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 @app.errorhandler(413)
 def request_entity_too_large(e):